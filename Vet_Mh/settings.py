@@ -106,7 +106,8 @@ MIDDLEWARE = [
 # ──────────────────────────────────────────────────────────────────────────────
 ROOT_URLCONF = "Vet_Mh.urls"
 WSGI_APPLICATION = "Vet_Mh.wsgi.application"
-# (Keep asgi.py too, for future async; no setting needed here)
+# Production serves asgi.py (gunicorn + uvicorn workers) so /chat/stream/ can stream tokens
+ASGI_APPLICATION = "Vet_Mh.asgi.application"
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Templates
@@ -189,6 +190,31 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # ──────────────────────────────────────────────────────────────────────────────
 LOGIN_REDIRECT_URL = "/chat/"
 LOGOUT_REDIRECT_URL = "/"
+# ──────────────────────────────────────────────────────────────────────────────
+# Cache + sessions (one tier shared by every worker)
+# ──────────────────────────────────────────────────────────────────────────────
+# sqlite (default): one file on the host, no service to run (ai_mhbot/cache_backends.py)
+# redis: REDIS_URL, for several hosts (needs the `redis` package)
+# locmem: per process only
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "sqlite")
+if CACHE_BACKEND == "redis":
+    _default_cache = {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0"),
+    }
+elif CACHE_BACKEND == "sqlite":
+    _default_cache = {
+        "BACKEND": "ai_mhbot.cache_backends.SQLiteCache",
+        "LOCATION": os.getenv("CACHE_LOCATION") or str(BASE_DIR / ".cache" / "django_cache.sqlite3"),
+        "OPTIONS": {"MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "20000"))},
+    }
+else:
+    _default_cache = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+CACHES = {"default": _default_cache}
+
+# Sessions are read from the cache; the DB row is only written when the session changes
+SESSION_ENGINE = os.getenv("SESSION_ENGINE", "django.contrib.sessions.backends.cached_db")
+
 LOGIN_URL = "/login/"
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -205,6 +231,53 @@ OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY", "")
 
+# Chat reply cache (ai_mhbot/response_cache.py): local = per-process LRU, django = CACHES alias
+CHAT_CACHE_BACKEND = os.getenv("CHAT_CACHE_BACKEND", "local")  # local | django | off
+CHAT_CACHE_ALIAS = os.getenv("CHAT_CACHE_ALIAS", "default")
+CHAT_CACHE_TTL = int(os.getenv("CHAT_CACHE_TTL", "3600"))  # seconds
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "512"))
+
+# Prompt assembly (ai_mhbot/prompting.py): few-shots per message and total prompt budget
+CHAT_FEW_SHOT_K = int(os.getenv("CHAT_FEW_SHOT_K", "3"))
+CHAT_PROMPT_TOKEN_BUDGET = int(os.getenv("CHAT_PROMPT_TOKEN_BUDGET", "1200"))
+# Conversation memory (ai_mhbot/memory.py): recent turns verbatim + rolling summary of older ones
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "800"))
+CHAT_SUMMARY_TOKEN_BUDGET = int(os.getenv("CHAT_SUMMARY_TOKEN_BUDGET", "250"))
+# Per-user chat limits (ai_mhbot/rate_limit.py): counters live in a CACHES alias shared by all workers
+CHAT_RATE_LIMIT_ENABLED = os.getenv("CHAT_RATE_LIMIT_ENABLED", "true").lower() == "true"
+CHAT_RATE_LIMIT_ALIAS = os.getenv("CHAT_RATE_LIMIT_ALIAS", "default")
+CHAT_RATE_LIMIT_REQUESTS = int(os.getenv("CHAT_RATE_LIMIT_REQUESTS", "8"))  # per window, per user
+CHAT_RATE_LIMIT_WINDOW = int(os.getenv("CHAT_RATE_LIMIT_WINDOW", "60"))  # seconds (sliding)
+CHAT_DAILY_TOKEN_BUDGET = int(os.getenv("CHAT_DAILY_TOKEN_BUDGET", "60000"))  # est. tokens/user/day; 0 = off
+# Chat archive (ai_mhbot/chat_archive.py, run: python manage.py archive_chat): conversations idle
+# this long move to compressed per-user-per-month ChatArchive rows
+CHAT_ARCHIVE_AFTER_DAYS = int(os.getenv("CHAT_ARCHIVE_AFTER_DAYS", "180"))
+
+# Veterans Nearby: local facility index (ai_mhbot/facility_index.py, load with import_va_facilities)
+VETS_GOOGLE_MODE = os.getenv("VETS_GOOGLE_MODE", "fallback")  # fallback | merge | off
+VETS_FACILITY_INDEX_REFRESH = int(os.getenv("VETS_FACILITY_INDEX_REFRESH", "60"))  # seconds between change checks
+
+# Veterans Nearby result cache (ai_mhbot/places_cache.py): geohash cell / place text -> results
+PLACES_CACHE_ENABLED = os.getenv("PLACES_CACHE_ENABLED", "true").lower() == "true"
+PLACES_CACHE_ALIAS = os.getenv("PLACES_CACHE_ALIAS", "default")  # "default" is the shared tier (CACHE_BACKEND)
+PLACES_CACHE_TTL = int(os.getenv("PLACES_CACHE_TTL", str(7 * 24 * 3600)))  # facilities rarely move
+# Place Details (phone/website) per place_id: served as fresh for FRESH, then stale-while-revalidate until TTL
+PLACES_DETAILS_FRESH = int(os.getenv("PLACES_DETAILS_FRESH", str(7 * 24 * 3600)))
+PLACES_DETAILS_TTL = int(os.getenv("PLACES_DETAILS_TTL", str(30 * 24 * 3600)))
+
+# Login audit (ai_mhbot/audit.py): LoginEvents are buffered + spilled to disk, then bulk-inserted
+AUDIT_BUFFERED = os.getenv("AUDIT_BUFFERED", "true").lower() == "true"
+AUDIT_FLUSH_SIZE = int(os.getenv("AUDIT_FLUSH_SIZE", "50"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "2"))
+AUDIT_SPILL_DIR = os.getenv("AUDIT_SPILL_DIR", "")  # default: <tmp>/vetmh_audit; use a volume in prod
+
+# Background job queue (ai_mhbot/jobs.py, worker: python manage.py run_jobs)
+# Run jobs inline (no worker needed). On by default with DEBUG so plain `runserver`
+# still writes moods and exercise completions; production runs `manage.py run_jobs`.
+JOBS_EAGER = os.getenv("JOBS_EAGER", str(DEBUG)).lower() == "true"
+JOBS_VISIBILITY_TIMEOUT = int(os.getenv("JOBS_VISIBILITY_TIMEOUT", "60"))  # seconds before a stuck job is retried
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "5"))
+
 # Optional django-axes defaults (only effective if "axes" installed & middleware enabled)
 AXES_ENABLED = os.getenv("AXES_ENABLED", "false").lower() == "true"
 AXES_FAILURE_LIMIT = int(os.getenv("AXES_FAILURE_LIMIT", "5"))
@@ -0,0 +1,19 @@
+"""
+Settings for `manage.py test` (picked by manage.py unless DJANGO_SETTINGS_MODULE is set).
+
+Everything comes from settings.py, so the suite runs the shipped configuration
+(SQLite cache tier, rate limiter on, cached_db sessions), except:
+- the SQLite cache lives in a throwaway file per run, never the dev cache
+- login events are written synchronously: a buffered event must not outlive
+  its test's transaction (AuditWriterTests turn buffering back on)
+"""
+
+import tempfile
+
+from .settings import *  # noqa: F401,F403
+from .settings import CACHES, os
+
+if CACHES["default"]["BACKEND"] == "ai_mhbot.cache_backends.SQLiteCache":
+    CACHES["default"]["LOCATION"] = os.path.join(tempfile.mkdtemp(prefix="vetmh_test_cache_"), "cache.sqlite3")
+
+AUDIT_BUFFERED = False
@@ -23,6 +23,10 @@ from ai_mhbot.views import (
     resources,
     feedback,
     chat,
+    chat_stream,
+    chat_export,
+    perf_stats,
+    staff_search,
     signup,
     profile,
     exercise_breathing,
@@ -30,6 +34,7 @@ from ai_mhbot.views import (
     exercise_sleep,
     exercise_complete,
     mood_dashboard,
+    mood_entries_api,
     mood_add,
     veterans_nearby,
 )
@@ -63,6 +68,11 @@ urlpatterns = [
         name="password_change_done",
     ),
 
+    # Staff-only runtime counters (per worker process)
+    path("api/staff/stats", perf_stats, name="perf_stats"),
+    # Staff-only ranked full-text search over chat messages / mood notes
+    path("api/staff/search", staff_search, name="staff_search"),
+
     # Signup
     path("signup/", signup, name="signup"),
 
@@ -77,6 +87,8 @@ urlpatterns = [
 
     # Chat
     path("chat/", chat, name="chat"),
+    path("chat/stream/", chat_stream, name="chat_stream"),  # SSE; needs the ASGI server
+    path("chat/export/", chat_export, name="chat_export"),  # full history incl. archived months
 
     # Exercises
     path("exercise/breathing/", exercise_breathing, name="exercise_breathing"),
@@ -87,6 +99,7 @@ urlpatterns = [
     # Mood tracker
     path("mood/", mood_dashboard, name="mood_dashboard"),
     path("mood/add/", mood_add, name="mood_add"),  # added trailing slash for consistency
+    path("api/mood/entries", mood_entries_api, name="mood_entries_api"),  # keyset-paged history
 
     # Veterans Nearby
     path("vets/", lambda r: render(r, "app1/vets.html"), name="vets_page"),
@@ -1,26 +1,123 @@
+import ipaddress
+
 from django.contrib import admin
-from .models import ChatMessage, MoodEntry, LoginEvent
+from django.contrib.auth.models import User
+from django.db.models import Q
+
+from . import fulltext
+from .models import ChatArchive, ChatMessage, Job, MoodEntry, LoginEvent, UserAgent, VAFacility
 
 # Register your models here.
 
+class FullTextSearchMixin:
+    """
+    Admin search via the full-text index (fulltext.py) instead of LIKE '%...%'
+    over the text columns: rows matching search_fields (username prefix) OR the
+    index's top fulltext_limit hits. Without an index, fulltext_fallback_fields
+    are added to search_fields and Django's normal search runs.
+    """
+    fulltext_kind = None
+    fulltext_fallback_fields = ()
+    fulltext_limit = 500
+
+    def get_search_fields(self, request):
+        fields = tuple(super().get_search_fields(request))
+        if fulltext.backend(self.fulltext_kind) == "like":
+            fields += tuple(self.fulltext_fallback_fields)
+        return fields
+
+    def get_search_results(self, request, queryset, search_term):
+        matched, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        hits = fulltext.search_ids(self.fulltext_kind, search_term, self.fulltext_limit) if search_term.strip() else None
+        if hits is None:
+            return matched, may_have_duplicates
+        return matched | queryset.filter(pk__in=[pk for pk, _ in hits]), may_have_duplicates
+
+
 @admin.register(MoodEntry)
-class MoodEntryAdmin(admin.ModelAdmin):
+class MoodEntryAdmin(FullTextSearchMixin, admin.ModelAdmin):
     # Configuration for admin interface
     list_display = ("user","mood","created_at")
-    search_fields = ("user__username","note")
+    search_fields = ("^user__username",)
     list_filter = ("mood","created_at")
+    list_select_related = ("user",)
+    fulltext_kind = "mood"
+    fulltext_fallback_fields = ("note",)
 # Admin for LoginEvent model    
 @admin.register(LoginEvent)
 class LoginEventAdmin(admin.ModelAdmin):
     # Configuration for admin interface
-    list_display = ("timestamp", "event", "user", "ip_address")
-    list_filter = ("event", "timestamp")
-    search_fields = ("user__username", "ip_address", "username_tried", "user_agent")
+    list_display = ("timestamp", "event", "user", "ip_address", "user_agent")
+    list_filter = ("event", "timestamp", "user_agent__browser", "user_agent__device")
+    list_select_related = ("user", "user_agent")
+    ordering = ("-timestamp",)
+    # Shown as the search box's hint; get_search_results below does the lookups
+    search_fields = ("ip_address", "username_tried", "user__username")
     readonly_fields = ("timestamp",)
+    raw_id_fields = ("user", "user_agent")
+    user_prefix_limit = 200
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Index-friendly search (Django's ^/= search compiles to LIKE / UPPER()
+        and ORs across a join to auth_user, so it always scanned the table):
+        - an IP address: exact, case-sensitive ip_address = ... (loginevent_ip_ts_idx)
+        - anything else: case-sensitive username prefix, written as a range so
+          it can use loginevent_tried_idx and auth_user's username index; the
+          matching user ids are looked up first, so there's no join
+        """
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        try:
+            return queryset.filter(ip_address=str(ipaddress.ip_address(term))), False
+        except ValueError:
+            pass
+        prefix = {"__gte": term, "__lt": term + "\U0010ffff"}
+        user_ids = list(
+            User.objects.filter(**{f"username{k}": v for k, v in prefix.items()})
+            .values_list("pk", flat=True)[: self.user_prefix_limit]
+        )
+        tried = Q(**{f"username_tried{k}": v for k, v in prefix.items()})
+        return queryset.filter(tried | Q(user_id__in=user_ids)), False
+
+
+@admin.register(UserAgent)
+class UserAgentAdmin(admin.ModelAdmin):
+    list_display = ("browser", "browser_version", "os", "device", "first_seen")
+    list_filter = ("browser", "os", "device")
+    search_fields = ("raw",)
+    readonly_fields = ("hash", "raw", "first_seen")
 
 
 @admin.register(ChatMessage)
-class ChatMessageAdmin(admin.ModelAdmin):
+class ChatMessageAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ("user", "role", "created_at")
-    search_fields = ("user__username", "content")
+    search_fields = ("^user__username",)
+    readonly_fields = ("created_at",)
+    list_select_related = ("user",)
+    fulltext_kind = "chat"
+    fulltext_fallback_fields = ("content",)
+
+
+@admin.register(ChatArchive)
+class ChatArchiveAdmin(admin.ModelAdmin):
+    list_display = ("user", "month", "message_count", "raw_bytes", "first_at", "last_at")
+    list_select_related = ("user",)
+    search_fields = ("^user__username",)
+    exclude = ("data",)  # compressed blob; read it with chat_archive.iter_history
+    readonly_fields = ("user", "month", "message_count", "raw_bytes", "first_at", "last_at", "updated_at")
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "status", "attempts", "run_after", "created_at")
+    list_filter = ("status", "name")
     readonly_fields = ("created_at",)
+
+
+@admin.register(VAFacility)
+class VAFacilityAdmin(admin.ModelAdmin):
+    list_display = ("name", "kind", "city", "state", "zip_code", "updated_at")
+    list_filter = ("kind", "state")
+    search_fields = ("name", "city", "zip_code", "external_id")
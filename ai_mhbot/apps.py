@@ -9,3 +9,9 @@ class AiMhbotConfig(AppConfig):
         # Registers signal handlers when the app loads.
         # This import path and integration were added with help from ChatGPT (GPT-5).
         from . import signals
+        # Registers background job handlers (see jobs.py / run_jobs command).
+        from . import tasks
+        # Keeps MoodSummary in step with every MoodEntry write.
+        from . import mood_rollup
+        # Flushes buffered LoginEvents after requests and at exit.
+        from . import audit
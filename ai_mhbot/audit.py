@@ -0,0 +1,279 @@
+"""
+Buffered LoginEvent writer: the auth request path does no INSERT.
+
+- record(**fields) appends the event to an in-memory buffer and, as one JSON
+  line, to this worker's spill file, so a crash or kill loses nothing
+- flush() writes the whole buffer with one bulk_create, then drops the spill
+  file. It runs when the buffer reaches AUDIT_FLUSH_SIZE, after a request has
+  finished once the oldest event is AUDIT_FLUSH_SECONDS old, and at exit
+- Spill files left behind by dead workers are replayed on the next flush
+- Spill files live under a directory per database, so events never replay
+  into a different DB (e.g. a test run's leftovers into the dev database)
+- AUDIT_BUFFERED=false writes every event immediately instead
+
+Settings: AUDIT_BUFFERED, AUDIT_FLUSH_SIZE, AUDIT_FLUSH_SECONDS, AUDIT_SPILL_DIR.
+"""
+
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import secrets
+import tempfile
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.signals import request_finished
+from django.db import IntegrityError, connections, transaction
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import LoginEvent
+from . import user_agents
+
+logger = logging.getLogger(__name__)
+
+# "<pid>-<token>.jsonl", optionally with ".<n>.flushing" while a flush is in progress
+_SPILL_NAME = re.compile(r"^(\d+)-([0-9a-f]+)\.jsonl(\.\d+\.flushing)?$")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AuditWriter:
+    def __init__(self, spill_dir: str = None):
+        self._spill_dir = spill_dir
+        self._lock = threading.Lock()        # buffer + spill file
+        self._flush_lock = threading.Lock()  # one flush at a time
+        self._reset()
+
+    def _reset(self) -> None:
+        self._buffer: List[Dict] = []
+        self._oldest = None
+        self._token = secrets.token_hex(4)  # tells this process's files apart from a recycled pid's
+        self._recovered_at = 0.0
+        self._stats = {"recorded": 0, "flushed": 0, "flushes": 0, "failures": 0, "recovered": 0}
+
+    def after_fork(self) -> None:
+        """The parent's buffer is the parent's to flush; start clean in the child."""
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+    # --- config ---
+    @property
+    def buffered(self) -> bool:
+        return getattr(settings, "AUDIT_BUFFERED", True)
+
+    @property
+    def flush_size(self) -> int:
+        return getattr(settings, "AUDIT_FLUSH_SIZE", 50)
+
+    @property
+    def flush_seconds(self) -> float:
+        return getattr(settings, "AUDIT_FLUSH_SECONDS", 2.0)
+
+    def spill_dir(self) -> str:
+        if self._spill_dir:
+            return self._spill_dir
+        base = getattr(settings, "AUDIT_SPILL_DIR", "") or os.path.join(tempfile.gettempdir(), "vetmh_audit")
+        db_name = str(connections["default"].settings_dict.get("NAME", ""))
+        return os.path.join(base, hashlib.sha256(db_name.encode("utf-8")).hexdigest()[:12])
+
+    def _spill_path(self) -> str:
+        return os.path.join(self.spill_dir(), f"{os.getpid()}-{self._token}.jsonl")
+
+    def _own_prefix(self) -> str:
+        return f"{os.getpid()}-{self._token}.jsonl"
+
+    # --- write path ---
+    def record(self, **fields) -> None:
+        """Queue one LoginEvent (same kwargs as LoginEvent.objects.create, with user → user_id)."""
+        user = fields.pop("user", None)
+        event = {
+            "user_id": getattr(user, "pk", None) if user is not None else fields.pop("user_id", None),
+            "event": fields.get("event", ""),
+            "ip_address": fields.get("ip_address"),
+            "user_agent": fields.get("user_agent", "") or "",
+            "username_tried": fields.get("username_tried", "") or "",
+            "timestamp": timezone.now().isoformat(),
+        }
+        if not self.buffered:
+            self._write([event])
+            return
+
+        with self._lock:
+            try:
+                os.makedirs(self.spill_dir(), exist_ok=True)
+                with open(self._spill_path(), "a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(event) + "\n")
+            except OSError:
+                logger.warning("Audit spill file not writable; event is only buffered in memory")
+            self._buffer.append(event)
+            self._stats["recorded"] += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            full = len(self._buffer) >= self.flush_size
+        if full:
+            self.flush()
+
+    def due(self) -> bool:
+        with self._lock:
+            if not self._buffer:
+                return False
+            return len(self._buffer) >= self.flush_size or time.monotonic() - self._oldest >= self.flush_seconds
+
+    def _rows(self, events: List[Dict]) -> List[LoginEvent]:
+        # Events (and spill files) carry the raw string; the row gets the UserAgent id.
+        agents = user_agents.intern_user_agents(e["user_agent"] for e in events)
+        return [
+            LoginEvent(
+                user_id=e["user_id"],
+                event=e["event"],
+                ip_address=e["ip_address"],
+                user_agent_id=agents.get(e["user_agent"]),
+                username_tried=e["username_tried"],
+                timestamp=datetime.fromisoformat(e["timestamp"]),
+            )
+            for e in events
+        ]
+
+    def _write(self, events: List[Dict]) -> None:
+        rows = self._rows(events)
+        try:
+            with transaction.atomic():
+                LoginEvent.objects.bulk_create(rows, batch_size=500)
+        except IntegrityError:
+            # A user deleted since the event was queued: keep the event, drop the link.
+            # (Or a cached UserAgent id whose row is gone: look the agents up again.)
+            user_agents.clear_cache()
+            rows = self._rows(events)
+            known = set(get_user_model().objects.filter(pk__in={r.user_id for r in rows}).values_list("pk", flat=True))
+            for r in rows:
+                if r.user_id not in known:
+                    r.user_id = None
+            with transaction.atomic():
+                LoginEvent.objects.bulk_create(rows, batch_size=500)
+
+    def flush(self) -> int:
+        """Write everything buffered (plus orphaned spill files); returns events written."""
+        with self._flush_lock:
+            self._recover_orphans()
+            with self._lock:
+                batch, self._buffer, self._oldest = self._buffer, [], None
+                if not batch:
+                    return 0
+                # New events go to a fresh spill file while this batch is written.
+                spill = self._spill_path()
+                if os.path.exists(spill):
+                    os.replace(spill, f"{spill}.{time.time_ns()}.flushing")
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Audit flush of %d events failed; will retry", len(batch))
+                with self._lock:
+                    self._buffer[:0] = batch
+                    self._oldest = time.monotonic()
+                    self._stats["failures"] += 1
+                return 0
+            self._remove_own_flushing_files()
+            with self._lock:
+                self._stats["flushed"] += len(batch)
+                self._stats["flushes"] += 1
+            return len(batch)
+
+    def _remove_own_flushing_files(self) -> None:
+        # Every event in them was in the batch just written (failed flushes re-buffer theirs).
+        prefix = self._own_prefix() + "."
+        try:
+            for entry in os.scandir(self.spill_dir()):
+                if entry.name.startswith(prefix) and entry.name.endswith(".flushing"):
+                    os.unlink(entry.path)
+        except OSError:
+            pass
+
+    def _recover_orphans(self, every: float = 60.0) -> None:
+        """Replay spill files whose worker is gone (checked at most once a minute)."""
+        now = time.monotonic()
+        if self._recovered_at and now - self._recovered_at < every:
+            return
+        self._recovered_at = now
+        try:
+            entries = list(os.scandir(self.spill_dir()))
+        except OSError:
+            return
+        me = os.getpid()
+        for entry in entries:
+            m = _SPILL_NAME.match(entry.name)
+            if not m:
+                continue
+            pid, token = int(m.group(1)), m.group(2)
+            if token == self._token or (pid != me and _pid_alive(pid)):
+                continue  # ours, or a live sibling's
+            claimed = f"{entry.path}.recovering.{me}"
+            try:
+                os.replace(entry.path, claimed)  # only one process wins the rename
+            except OSError:
+                continue
+            try:
+                with open(claimed, "r", encoding="utf-8") as fh:
+                    events = [json.loads(line) for line in fh if line.strip()]
+                if events:
+                    self._write(events)
+                os.unlink(claimed)
+                self._stats["recovered"] += len(events)
+            except Exception:
+                logger.exception("Could not replay audit spill file %s", entry.name)
+                try:
+                    os.replace(claimed, entry.path)
+                except OSError:
+                    pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            snap = dict(self._stats)
+            snap["buffered"] = len(self._buffer)
+        snap["mode"] = "buffered" if self.buffered else "sync"
+        return snap
+
+
+audit_writer = AuditWriter()
+
+
+def record_login_event(**fields) -> None:
+    audit_writer.record(**fields)
+
+
+@receiver(request_finished)
+def flush_when_due(sender, **kwargs):
+    # After the response has gone out, so the user never waits on the batch INSERT.
+    if audit_writer.due():
+        try:
+            audit_writer.flush()
+        except Exception:
+            logger.exception("Audit flush failed")
+
+
+def _flush_at_exit():
+    try:
+        audit_writer.flush()
+    except Exception:
+        pass  # events stay in the spill file and are replayed by the next worker
+
+
+atexit.register(_flush_at_exit)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=audit_writer.after_fork)
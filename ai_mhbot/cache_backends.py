@@ -0,0 +1,171 @@
+"""
+SQLite-file cache backend: a CACHES tier every worker on the host shares,
+with no extra service to run (the default; Redis is the option for multi-host).
+
+- One small SQLite database (WAL mode) per LOCATION; each thread opens its own
+  connection (reopened after fork)
+- add / incr / decr are atomic across processes: they run inside
+  BEGIN IMMEDIATE, which takes SQLite's write lock, so rate_limit.py counters,
+  places_cache.claim_refresh and cached_db sessions behave as on Redis
+- Integers are stored as SQLite integers, everything else pickled
+- Expired rows are ignored on read and culled every CULL_EVERY writes, along
+  with the soonest-to-expire rows once MAX_ENTRIES is exceeded
+
+    CACHES = {"default": {
+        "BACKEND": "ai_mhbot.cache_backends.SQLiteCache",
+        "LOCATION": "/var/tmp/vetmh_cache.sqlite3",
+        "OPTIONS": {"MAX_ENTRIES": 20000},
+    }}
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+NEVER = 1e18           # "expires" for entries without a timeout
+CULL_EVERY = 200       # writes between sweeps
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._writes = 0
+
+    # --- connection ---
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self._path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _atomic(self, fn):
+        """Run fn(conn) in one write transaction (atomic across processes)."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    def _write(self, fn):
+        result = self._atomic(fn)
+        self._writes += 1
+        if self._writes % CULL_EVERY == 0:
+            self._atomic(self._cull)
+        return result
+
+    # --- encoding ---
+    @staticmethod
+    def _encode(value):
+        if type(value) is int:
+            return value
+        return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _decode(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def _expiry(self, timeout) -> float:
+        expires = self.get_backend_timeout(timeout)
+        return NEVER if expires is None else expires
+
+    # --- BaseCache API ---
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now, expires, encoded = time.time(), self._expiry(timeout), self._encode(value)
+
+        def run(conn):
+            cur = conn.execute(
+                "INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires "
+                "WHERE cache.expires <= ?",
+                (key, encoded, expires, now),
+            )
+            return cur.rowcount == 1
+
+        return self._write(run)
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return default if row is None else self._decode(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires, encoded = self._expiry(timeout), self._encode(value)
+        self._write(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)", (key, encoded, expires)
+        ))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self._expiry(timeout)
+        return self._write(lambda conn: conn.execute(
+            "UPDATE cache SET expires = ? WHERE key = ? AND expires > ?", (expires, key, time.time())
+        ).rowcount == 1)
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda conn: conn.execute("DELETE FROM cache WHERE key = ?", (key,)).rowcount == 1)
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._conn().execute(
+            "SELECT 1 FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone() is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def run(conn):
+            row = conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = self._decode(row[0]) + delta
+            conn.execute("UPDATE cache SET value = ? WHERE key = ?", (self._encode(value), key))
+            return value
+
+        return self._write(run)
+
+    def clear(self):
+        self._write(lambda conn: conn.execute("DELETE FROM cache"))
+
+    def close(self, **kwargs):
+        pass  # per-thread connections stay open for the next request
+
+    # --- housekeeping ---
+    def _cull(self, conn) -> None:
+        conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+        (count,) = conn.execute("SELECT COUNT(*) FROM cache").fetchone()
+        if count > self._max_entries:
+            # like Django's own backends: drop 1/CULL_FREQUENCY extra (0 = everything)
+            doomed = count if not self._cull_frequency else count - self._max_entries + count // self._cull_frequency
+            conn.execute("DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires LIMIT ?)", (doomed,))
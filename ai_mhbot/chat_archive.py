@@ -0,0 +1,134 @@
+"""
+Cold storage for old chat history.
+
+- archive_older_than(days) moves whole conversations (sessions) whose newest
+  message is older than `days` out of ChatMessage into ChatArchive: one row per
+  user per month, the messages as zlib-compressed compact JSON. A session
+  still in use is never split, so memory.py always sees every turn it reads
+- Each batch is one transaction: archive rows written, hot rows deleted
+- Archiving again into a month that already has a row merges into it (by id,
+  so a rerun never duplicates a message)
+- iter_history(user) reads archive + hot table back as one oldest-first
+  stream of plain dicts; history pages and the export use only that
+- Rows whose user was deleted (user=NULL) are left in the hot table
+
+Settings: CHAT_ARCHIVE_AFTER_DAYS (default for `manage.py archive_chat`).
+"""
+
+import heapq
+import json
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ChatArchive, ChatMessage
+
+FIELDS = ("id", "session_id", "role", "content", "meta", "created_at")
+SESSION_BATCH = 200  # sessions per transaction (keeps IN (...) under SQLite's variable limit)
+
+
+# ------------------------- encoding -------------------------
+def pack(messages: List[Dict]) -> bytes:
+    rows = [{**m, "created_at": m["created_at"].isoformat()} for m in messages]
+    raw = json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return zlib.compress(raw, 9)
+
+
+def unpack(blob) -> List[Dict]:
+    rows = json.loads(zlib.decompress(bytes(blob)).decode("utf-8"))
+    for row in rows:
+        row["created_at"] = datetime.fromisoformat(row["created_at"])
+    return rows
+
+
+def _order(msg: Dict):
+    return msg["created_at"], msg["id"]
+
+
+def _month(dt: datetime) -> date:
+    return timezone.localtime(dt).date().replace(day=1)
+
+
+# ------------------------- archiving -------------------------
+def stale_sessions(cutoff: datetime) -> List[str]:
+    """Sessions (with a user) whose newest message is older than cutoff."""
+    return list(
+        ChatMessage.objects.filter(user__isnull=False)
+        .order_by()
+        .values("session_id")
+        .annotate(last=Max("created_at"))
+        .filter(last__lt=cutoff)
+        .values_list("session_id", flat=True)
+    )
+
+
+def _merge_into(user_id: int, month: date, messages: List[Dict]) -> None:
+    archive = ChatArchive.objects.select_for_update().filter(user_id=user_id, month=month).first()
+    by_id = {m["id"]: m for m in (unpack(archive.data) if archive else [])}
+    by_id.update((m["id"], m) for m in messages)
+    merged = sorted(by_id.values(), key=_order)
+    blob = pack(merged)
+    archive = archive or ChatArchive(user_id=user_id, month=month)
+    archive.data = blob
+    archive.message_count = len(merged)
+    archive.first_at = merged[0]["created_at"]
+    archive.last_at = merged[-1]["created_at"]
+    archive.raw_bytes = len(zlib.decompress(blob))
+    archive.save()
+
+
+def archive_older_than(days: int, dry_run: bool = False) -> Dict[str, int]:
+    """Move conversations idle for more than `days` into ChatArchive; returns counts."""
+    cutoff = timezone.now() - timedelta(days=days)
+    sessions = stale_sessions(cutoff)
+    totals = {"sessions": len(sessions), "messages": 0, "archives": 0}
+    for i in range(0, len(sessions), SESSION_BATCH):
+        chunk = sessions[i:i + SESSION_BATCH]
+        qs = ChatMessage.objects.filter(session_id__in=chunk, user__isnull=False)
+        if dry_run:
+            totals["messages"] += qs.count()
+            continue
+        with transaction.atomic():
+            groups = defaultdict(list)
+            for row in qs.order_by("created_at", "id").values("user_id", *FIELDS):
+                groups[(row.pop("user_id"), _month(row["created_at"]))].append(row)
+            for (user_id, month), messages in groups.items():
+                _merge_into(user_id, month, messages)
+                totals["messages"] += len(messages)
+            totals["archives"] += len(groups)
+            qs.delete()
+    return totals
+
+
+# ------------------------- read-back -------------------------
+def _archived(user, start: Optional[date], end: Optional[date]) -> Iterator[Dict]:
+    archives = ChatArchive.objects.filter(user=user)
+    if start:
+        archives = archives.filter(month__gte=start.replace(day=1))
+    if end:
+        archives = archives.filter(month__lte=end)
+    for archive in archives.order_by("month").only("data").iterator():
+        for msg in unpack(archive.data):
+            day = timezone.localtime(msg["created_at"]).date()
+            if (start and day < start) or (end and day > end):
+                continue
+            yield msg
+
+
+def _hot(user, start: Optional[date], end: Optional[date]) -> Iterator[Dict]:
+    qs = ChatMessage.objects.filter(user=user)
+    if start:
+        qs = qs.filter(created_at__date__gte=start)
+    if end:
+        qs = qs.filter(created_at__date__lte=end)
+    yield from qs.order_by("created_at", "id").values(*FIELDS).iterator(chunk_size=500)
+
+
+def iter_history(user, start: Optional[date] = None, end: Optional[date] = None) -> Iterator[Dict]:
+    """Every message of `user` (archived or not), oldest first, optionally limited to local days."""
+    return heapq.merge(_archived(user, start, end), _hot(user, start, end), key=_order)
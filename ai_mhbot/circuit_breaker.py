@@ -0,0 +1,206 @@
+"""
+Circuit breaker for the OpenAI backend, shared by every worker on the host.
+
+- closed: calls go through; outcomes are counted in 10 s buckets over a rolling window
+- open: once the window holds at least MIN_CALLS outcomes and the failure
+  rate reaches FAILURE_RATE, callers skip OpenAI and get the fallback right away
+- half_open: after COOLDOWN seconds one caller is let through as a probe;
+  success closes the circuit, failure re-opens it for another cooldown
+
+State lives in a small JSON file guarded by a file lock (locking.py), so all
+gunicorn workers see the same circuit. If the lock is busy or the file is
+unreadable the breaker fails open (lets the call through) instead of blocking.
+
+The healthy path does no locking and no writes: allow() peeks at the file and
+returns at once while the circuit is closed, and successes are counted in
+process and flushed at most once per BUCKET_SECONDS (or with the next failure
+or probe result). The file is only rewritten when something changed.
+Every call may still touch the disk, so async callers run them in a thread.
+
+Env: OPENAI_BREAKER_ENABLED, OPENAI_BREAKER_WINDOW, OPENAI_BREAKER_MIN_CALLS,
+OPENAI_BREAKER_FAILURE_RATE, OPENAI_BREAKER_COOLDOWN, OPENAI_BREAKER_STATE_FILE.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from .env import env_float, env_int
+from .locking import LockTimeout, file_lock
+
+BUCKET_SECONDS = 10
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, state_file: Optional[str] = None):
+        self.name = name
+        self.state_file = state_file or os.getenv(
+            "OPENAI_BREAKER_STATE_FILE",
+            os.path.join(tempfile.gettempdir(), f"vetmh_breaker_{name}.json"),
+        )
+        self.lock_file = self.state_file + ".lock"
+        self._pending_lock = threading.Lock()
+        self._pending_ok = 0       # successes not yet written to the state file
+        self._flush_at = 0.0
+        self._last_state = None    # state this process last saw (None: unknown)
+
+    # --- config (env, read per call so tests/ops can tweak at runtime) ---
+    @property
+    def enabled(self) -> bool:
+        return os.getenv("OPENAI_BREAKER_ENABLED", "true").lower() == "true"
+
+    @property
+    def window(self) -> float:
+        return env_float("OPENAI_BREAKER_WINDOW", 60.0)
+
+    @property
+    def min_calls(self) -> int:
+        return env_int("OPENAI_BREAKER_MIN_CALLS", 5)
+
+    @property
+    def failure_rate(self) -> float:
+        return env_float("OPENAI_BREAKER_FAILURE_RATE", 0.5)
+
+    @property
+    def cooldown(self) -> float:
+        return env_float("OPENAI_BREAKER_COOLDOWN", 30.0)
+
+    # --- storage ---
+    def _fresh(self) -> Dict:
+        return {"state": CLOSED, "opened_at": 0.0, "probe_until": 0.0, "buckets": {}}
+
+    def _load(self) -> Dict:
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+            return data if isinstance(data, dict) and "state" in data else self._fresh()
+        except (OSError, ValueError):
+            return self._fresh()
+
+    def _save(self, data: Dict) -> None:
+        tmp = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp, self.state_file)  # atomic swap: readers never see half a file
+
+    def _prune(self, data: Dict, now: float) -> None:
+        oldest = now - self.window
+        data["buckets"] = {k: v for k, v in data["buckets"].items() if float(k) + BUCKET_SECONDS > oldest}
+
+    def _counts(self, data: Dict):
+        ok = sum(v[0] for v in data["buckets"].values())
+        failed = sum(v[1] for v in data["buckets"].values())
+        return ok, failed
+
+    # --- public API ---
+    def allow(self) -> bool:
+        """May this caller try OpenAI now? Grants the single half-open probe when due."""
+        if not self.enabled:
+            return True
+        if self._load()["state"] == CLOSED:  # lock-free peek: os.replace never shows half a file
+            self._last_state = CLOSED
+            return True
+        now = time.time()
+        try:
+            with file_lock(self.lock_file, timeout=0.25):
+                data = self._load()
+                self._last_state = data["state"]
+                if data["state"] == CLOSED:
+                    return True
+                if data["state"] == OPEN and now - data["opened_at"] < self.cooldown:
+                    return False
+                if data["state"] == HALF_OPEN and now < data["probe_until"]:
+                    return False  # someone else's probe is still in flight
+                # Cooldown over (or the last probe never reported back): this caller probes.
+                data["state"] = HALF_OPEN
+                data["probe_until"] = now + self.cooldown
+                self._save(data)
+                self._last_state = HALF_OPEN
+                return True
+        except (LockTimeout, OSError):
+            return True
+
+    def _record(self, failed: bool) -> None:
+        now = time.time()
+        with self._pending_lock:
+            ok, self._pending_ok = self._pending_ok, 0
+            self._flush_at = now + BUCKET_SECONDS
+        if not (ok or failed):
+            return
+        try:
+            with file_lock(self.lock_file, timeout=0.25):
+                data = self._load()
+                self._prune(data, now)
+                key = str(int(now // BUCKET_SECONDS * BUCKET_SECONDS))
+                bucket = data["buckets"].setdefault(key, [0, 0])
+                bucket[0] += ok
+                bucket[1] += int(failed)
+
+                if data["state"] == HALF_OPEN:
+                    if failed:
+                        data.update(state=OPEN, opened_at=now)
+                    else:
+                        data = self._fresh()
+                elif data["state"] == CLOSED and failed:
+                    good, bad = self._counts(data)
+                    if good + bad >= self.min_calls and bad / (good + bad) >= self.failure_rate:
+                        data.update(state=OPEN, opened_at=now)
+                self._save(data)
+                self._last_state = data["state"]
+        except (LockTimeout, OSError):
+            with self._pending_lock:
+                self._pending_ok += ok  # keep them for the next flush
+
+    def record_success(self) -> None:
+        if not self.enabled:
+            return
+        with self._pending_lock:
+            self._pending_ok += 1
+            if self._last_state == CLOSED and time.time() < self._flush_at:
+                return  # nothing changes yet: counted with the next flush
+        self._record(failed=False)
+
+    def record_failure(self) -> None:
+        if self.enabled:
+            self._record(failed=True)
+
+    def after_fork(self) -> None:
+        """Forked children start without the parent's unflushed successes."""
+        self._pending_lock = threading.Lock()
+        self._pending_ok, self._flush_at, self._last_state = 0, 0.0, None
+
+    def reset(self) -> None:
+        with self._pending_lock:
+            self._pending_ok, self._last_state = 0, None
+        try:
+            with file_lock(self.lock_file, timeout=1.0):
+                self._save(self._fresh())
+        except (LockTimeout, OSError):
+            pass
+
+    def snapshot(self) -> Dict:
+        data = self._load()
+        self._prune(data, time.time())
+        ok, bad = self._counts(data)
+        ok += self._pending_ok
+        return {
+            "name": self.name,
+            "state": data["state"],
+            "opened_at": data["opened_at"] or None,
+            "window_ok": ok,
+            "window_failed": bad,
+            "enabled": self.enabled,
+        }
+
+
+openai_breaker = CircuitBreaker("openai")
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=openai_breaker.after_fork)
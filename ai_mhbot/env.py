@@ -0,0 +1,22 @@
+"""
+Typed reads of runtime env knobs (pool sizes, timeouts, breaker thresholds).
+
+Read at call time rather than frozen in settings, so tests and ops can change
+them without a restart; a missing or malformed value falls back to the default.
+"""
+
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
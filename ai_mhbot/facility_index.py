@@ -0,0 +1,244 @@
+"""
+In-memory nearest-facility search over the local VAFacility table.
+
+- Every facility is loaded once per process into NumPy arrays; a 1° lat/lng
+  grid maps each cell to the row numbers inside it
+- nearest(): collects the grid cells the search circle touches, computes the
+  haversine distance to all of those candidates in one vectorized step, then
+  walks them nearest-first, dropping duplicates (same name a few metres apart,
+  or the same kind of facility listed twice at one address), until `limit` are kept
+- search_text(): resolves a ZIP or "City, ST" against the dataset itself
+  (exact ZIP, then ZIP3 area, then city/state) and runs nearest() around it
+- The index rebuilds itself when the table changes: one COUNT/MAX query at most
+  every VETS_FACILITY_INDEX_REFRESH seconds
+
+Results use the same place shape as the Google path, so the frontend can't
+tell them apart (plus distanceMeters and source="local").
+"""
+
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote_plus
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import VAFacility
+from .places_cache import normalize_place
+
+EARTH_RADIUS_M = 6_371_008.8
+CELL_DEG = 1.0
+METERS_PER_DEG_LAT = 111_320.0
+DEDUP_METERS = 75.0
+DEFAULT_RADIUS_M = 32186  # ~20 miles, same default as the Google path
+DEFAULT_LIMIT = 20
+
+FIELDS = ("name", "kind", "address", "city", "state", "zip_code", "phone", "website", "latitude", "longitude")
+
+_ZIP = re.compile(r"\b(\d{5})(?:-\d{4})?\b")
+US_STATES = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA",
+    "colorado": "CO", "connecticut": "CT", "delaware": "DE", "district of columbia": "DC",
+    "florida": "FL", "georgia": "GA", "hawaii": "HI", "idaho": "ID", "illinois": "IL",
+    "indiana": "IN", "iowa": "IA", "kansas": "KS", "kentucky": "KY", "louisiana": "LA",
+    "maine": "ME", "maryland": "MD", "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK", "oregon": "OR",
+    "pennsylvania": "PA", "rhode island": "RI", "south carolina": "SC", "south dakota": "SD",
+    "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT", "virginia": "VA",
+    "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+    "puerto rico": "PR", "guam": "GU", "virgin islands": "VI",
+}
+
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in metres; arguments in radians, arrays broadcast."""
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def _cell(lat: float, lng: float) -> Tuple[int, int]:
+    return int(math.floor(lat / CELL_DEG)), int(math.floor(lng / CELL_DEG))
+
+
+def _one_line_address(row: Dict) -> str:
+    state_zip = " ".join(x for x in (row["state"], row["zip_code"]) if x)
+    return ", ".join(x for x in (row["address"], row["city"], state_zip) if x)
+
+
+def to_place(row: Dict, distance_m: float) -> Dict:
+    """Map a facility row into the Places API (New) shape the vets page renders."""
+    address = _one_line_address(row)
+    return {
+        "displayName": {"text": row["name"]},
+        "formattedAddress": address,
+        "location": {"latitude": row["latitude"], "longitude": row["longitude"]},
+        "googleMapsUri": "https://www.google.com/maps/search/?api=1&query=" + quote_plus(f"{row['name']} {address}"),
+        "nationalPhoneNumber": row["phone"] or None,
+        "internationalPhoneNumber": None,
+        "websiteUri": row["website"] or None,
+        "distanceMeters": int(round(distance_m)),
+        "source": "local",
+    }
+
+
+class FacilityIndex:
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+        lats = np.array([r["latitude"] for r in rows], dtype=np.float64)
+        lngs = np.array([r["longitude"] for r in rows], dtype=np.float64)
+        self.lat_rad = np.radians(lats)
+        self.lng_rad = np.radians(lngs)
+        self.names = [normalize_place(r["name"]) for r in rows]
+        self.addresses = [normalize_place(_one_line_address(r)) for r in rows]
+
+        cells = defaultdict(list)
+        by_zip, by_zip3, by_city = defaultdict(list), defaultdict(list), defaultdict(list)
+        for i, r in enumerate(rows):
+            cells[_cell(r["latitude"], r["longitude"])].append(i)
+            zip5 = (r["zip_code"] or "")[:5]
+            if zip5:
+                by_zip[zip5].append(i)
+                by_zip3[zip5[:3]].append(i)
+            if r["city"]:
+                by_city[(normalize_place(r["city"]), (r["state"] or "").upper())].append(i)
+        self.cells = {k: np.array(v, dtype=np.intp) for k, v in cells.items()}
+        self.by_zip, self.by_zip3, self.by_city = dict(by_zip), dict(by_zip3), dict(by_city)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _candidates(self, lat: float, lng: float, radius_m: float) -> np.ndarray:
+        dlat = radius_m / METERS_PER_DEG_LAT
+        dlng = radius_m / (METERS_PER_DEG_LAT * max(math.cos(math.radians(lat)), 0.01))
+        if dlng >= 180:
+            return np.arange(len(self.rows), dtype=np.intp)
+        (lat0, lng0), (lat1, lng1) = _cell(lat - dlat, lng - dlng), _cell(lat + dlat, lng + dlng)
+        n_lng_cells = int(360 / CELL_DEG)
+        parts = []
+        for ci in range(lat0, lat1 + 1):
+            for cj in range(lng0, lng1 + 1):
+                wrapped = (cj + n_lng_cells // 2) % n_lng_cells - n_lng_cells // 2  # across the antimeridian
+                part = self.cells.get((ci, wrapped))
+                if part is not None:
+                    parts.append(part)
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.intp)
+
+    def nearest(self, lat: float, lng: float, radius_m: float = DEFAULT_RADIUS_M,
+                limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        idx = self._candidates(lat, lng, radius_m)
+        if not idx.size:
+            return []
+        dist = haversine_m(math.radians(lat), math.radians(lng), self.lat_rad[idx], self.lng_rad[idx])
+        inside = dist <= radius_m
+        idx, dist = idx[inside], dist[inside]
+        order = np.argsort(dist, kind="stable")
+
+        kept: List[int] = []
+        out: List[Dict] = []
+        kept_addresses = set()
+        for j in order:
+            i = int(idx[j])
+            address = (self.addresses[i], self.rows[i]["kind"])
+            if address[0] and address in kept_addresses:
+                continue
+            if self._near_same_name(i, kept):
+                continue
+            kept.append(i)
+            kept_addresses.add(address)
+            out.append(to_place(self.rows[i], float(dist[j])))
+            if len(out) >= limit:
+                break
+        return out
+
+    def _near_same_name(self, i: int, kept: List[int]) -> bool:
+        same = [k for k in kept if self.names[k] == self.names[i]]
+        if not same:
+            return False
+        d = haversine_m(self.lat_rad[i], self.lng_rad[i], self.lat_rad[same], self.lng_rad[same])
+        return bool((d < DEDUP_METERS).any())
+
+    def _resolve_text(self, place: str) -> Optional[List[int]]:
+        zip_match = _ZIP.search(place or "")
+        if zip_match:
+            zip5 = zip_match.group(1)
+            return self.by_zip.get(zip5) or self.by_zip3.get(zip5[:3])
+        text = normalize_place(place)
+        for full, abbr in US_STATES.items():  # "tampa florida" -> "tampa fl"
+            if text.endswith(" " + full):
+                text = text[: -len(full)] + abbr.lower()
+                break
+        words = text.split()
+        if len(words) >= 2 and len(words[-1]) == 2:
+            return self.by_city.get((" ".join(words[:-1]), words[-1].upper()))
+        hits = [i for (city, _state), rows in self.by_city.items() if city == text for i in rows]
+        return hits or None
+
+    def search_text(self, place: str, radius_m: float = DEFAULT_RADIUS_M,
+                    limit: int = DEFAULT_LIMIT) -> List[Dict]:
+        """Facilities around a ZIP / city the dataset knows; [] when it can't place the text."""
+        matches = self._resolve_text(place)
+        if not matches:
+            return []
+        lat = float(np.degrees(self.lat_rad[matches].mean()))
+        lng = float(np.degrees(self.lng_rad[matches].mean()))
+        return self.nearest(lat, lng, radius_m, limit)
+
+
+def merge_places(local: List[Dict], extra: List[Dict]) -> List[Dict]:
+    """Local results first, then upstream places that aren't one of them (same name, or within DEDUP_METERS)."""
+    out = list(local)
+    if not extra:
+        return out
+    seen_names = {normalize_place(p["displayName"]["text"]) for p in local}
+    coords = np.radians(np.array(
+        [[p["location"]["latitude"], p["location"]["longitude"]] for p in local], dtype=np.float64
+    ).reshape(-1, 2))
+    for p in extra:
+        if normalize_place((p.get("displayName") or {}).get("text", "")) in seen_names:
+            continue
+        loc = p.get("location") or {}
+        if coords.size and loc.get("latitude") is not None and loc.get("longitude") is not None:
+            d = haversine_m(math.radians(loc["latitude"]), math.radians(loc["longitude"]), coords[:, 0], coords[:, 1])
+            if (d < DEDUP_METERS).any():
+                continue
+        out.append(p)
+    return out
+
+
+# ------------------------- per-process singleton -------------------------
+_index: Optional[FacilityIndex] = None
+_signature = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def invalidate() -> None:
+    global _checked_at
+    with _lock:
+        _checked_at = 0.0
+
+
+def get_index() -> FacilityIndex:
+    """The current index, rebuilt when the VAFacility table has changed."""
+    global _index, _signature, _checked_at
+    now = time.monotonic()
+    with _lock:
+        refresh = getattr(settings, "VETS_FACILITY_INDEX_REFRESH", 60)
+        if _index is not None and _checked_at and now - _checked_at < refresh:
+            return _index
+        stamp = VAFacility.objects.aggregate(n=Count("id"), latest=Max("updated_at"))
+        signature = (stamp["n"], stamp["latest"])
+        if _index is None or signature != _signature:
+            _index = FacilityIndex(list(VAFacility.objects.order_by("id").values(*FIELDS)))
+            _signature = signature
+        _checked_at = now
+        return _index
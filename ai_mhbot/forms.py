@@ -48,10 +48,10 @@ class CustomUserCreationForm(UserCreationForm):
         if commit:
             user.save()
 
-        # Ensure Profile exists, store phone there
+        # The post_save signal already created the Profile (and cached it on user); store phone there
         phone = (self.cleaned_data.get("phone") or "").strip()
-        profile, _ = Profile.objects.get_or_create(user=user)
-        if phone:
+        if commit and phone:
+            profile = user.profile
             profile.phone = phone
             profile.save(update_fields=["phone"])
 
@@ -0,0 +1,168 @@
+"""
+Full-text search over chat messages and mood notes (staff review).
+
+- SQLite: an FTS5 external-content table per model (text lives only in the
+  model's table; the FTS table holds the index), kept in sync by
+  INSERT/UPDATE/DELETE triggers, ranked with bm25()
+- PostgreSQL: a GIN index on to_tsvector('english', ...) of the same columns,
+  queried with websearch_to_tsquery, ranked with ts_rank
+- Both are created by migration 0017 (a frozen copy of install() below; call
+  install()/uninstall() yourself after a migration that rebuilds either table)
+- Any other database, or SQLite built without FTS5: search_ids() returns None
+  and callers fall back to icontains
+- Archived chat (chat_archive.py) leaves the hot table, so it leaves the index too
+
+User input is never passed through as query syntax: on SQLite every word is
+quoted (the last one as a prefix), on Postgres websearch_to_tsquery parses it.
+"""
+
+import re
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.db import connection
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+class Searchable(NamedTuple):
+    table: str
+    columns: Tuple[str, ...]
+
+    @property
+    def fts_table(self) -> str:
+        return f"{self.table}_fts"
+
+    @property
+    def gin_index(self) -> str:
+        return f"{self.table}_fts_gin"
+
+
+SEARCHABLE: Dict[str, Searchable] = {
+    "chat": Searchable("ai_mhbot_chatmessage", ("content",)),
+    "mood": Searchable("ai_mhbot_moodentry", ("note", "chat_user_text")),
+}
+
+
+# ------------------------- backend detection -------------------------
+def _sqlite_has_fts(cursor, spec: Searchable) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [spec.fts_table])
+    return cursor.fetchone() is not None
+
+
+def backend(kind: str = "chat", conn=None) -> str:
+    """"fts5", "postgres" or "like" (no index: plain icontains)."""
+    conn = conn or connection
+    if conn.vendor == "postgresql":
+        return "postgres"
+    if conn.vendor == "sqlite":
+        with conn.cursor() as cursor:
+            if _sqlite_has_fts(cursor, SEARCHABLE[kind]):
+                return "fts5"
+    return "like"
+
+
+# ------------------------- schema (same SQL as migration 0017) -------------------------
+def _sqlite_statements(spec: Searchable) -> List[str]:
+    cols = ", ".join(spec.columns)
+    new = ", ".join(f"new.{c}" for c in spec.columns)
+    old = ", ".join(f"old.{c}" for c in spec.columns)
+    fts = spec.fts_table
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({cols}, content='{spec.table}', content_rowid='id', "
+        f"tokenize='porter unicode61')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {spec.table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {spec.table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE OF {cols} ON {spec.table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",  # index rows that already exist
+    ]
+
+
+def _pg_document(spec: Searchable) -> str:
+    # Must match the query below exactly, or Postgres won't use the index.
+    return " || ' ' || ".join(f"coalesce({c}, '')" for c in spec.columns)
+
+
+def install(apps, schema_editor) -> None:
+    conn = schema_editor.connection
+    for spec in SEARCHABLE.values():
+        if conn.vendor == "sqlite":
+            with conn.cursor() as cursor:
+                try:
+                    cursor.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+                    cursor.execute("DROP TABLE temp._fts5_probe")
+                except Exception:
+                    return  # SQLite without FTS5: searches fall back to icontains
+            for sql in _sqlite_statements(spec):
+                schema_editor.execute(sql)
+        elif conn.vendor == "postgresql":
+            schema_editor.execute(
+                f"CREATE INDEX {spec.gin_index} ON {spec.table} "
+                f"USING GIN (to_tsvector('english', {_pg_document(spec)}))"
+            )
+
+
+def uninstall(apps, schema_editor) -> None:
+    conn = schema_editor.connection
+    for spec in SEARCHABLE.values():
+        if conn.vendor == "sqlite":
+            for suffix in ("ai", "ad", "au"):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {spec.fts_table}_{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {spec.fts_table}")
+        elif conn.vendor == "postgresql":
+            schema_editor.execute(f"DROP INDEX IF EXISTS {spec.gin_index}")
+
+
+# ------------------------- queries -------------------------
+def fts5_query(text: str) -> str:
+    """User text -> FTS5 MATCH expression: all words required, last one as a prefix."""
+    words = _WORD.findall(text or "")
+    if not words:
+        return ""
+    terms = [f'"{w}"' for w in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search_ids(kind: str, text: str, limit: int = 50) -> Optional[List[Tuple[int, float]]]:
+    """
+    [(pk, score)] best match first (higher score = better), or None when there
+    is no full-text index on this database (caller should use icontains).
+    """
+    spec = SEARCHABLE[kind]
+    mode = backend(kind)
+    if mode == "like":
+        return None
+    with connection.cursor() as cursor:
+        if mode == "fts5":
+            query = fts5_query(text)
+            if not query:
+                return []
+            # bm25() is lower-is-better; negate so every backend sorts the same way
+            cursor.execute(
+                f"SELECT rowid, -bm25({spec.fts_table}) FROM {spec.fts_table} "
+                f"WHERE {spec.fts_table} MATCH %s ORDER BY bm25({spec.fts_table}) LIMIT %s",
+                [query, limit],
+            )
+        else:
+            doc = f"to_tsvector('english', {_pg_document(spec)})"
+            cursor.execute(
+                f"SELECT id, ts_rank({doc}, q) FROM {spec.table}, websearch_to_tsquery('english', %s) q "
+                f"WHERE {doc} @@ q ORDER BY 2 DESC LIMIT %s",
+                [text, limit],
+            )
+        return [(row[0], float(row[1])) for row in cursor.fetchall()]
+
+
+def snippet(text: str, query: str, width: int = 160) -> str:
+    """About `width` characters of `text` around the first query word found."""
+    text = " ".join((text or "").split())
+    lowered = text.lower()
+    hits = [lowered.find(w.lower()) for w in _WORD.findall(query or "")]
+    hits = [h for h in hits if h >= 0]
+    start = max(min(hits) - width // 3, 0) if hits else 0
+    out = text[start:start + width]
+    return ("…" if start else "") + out + ("…" if start + width < len(text) else "")
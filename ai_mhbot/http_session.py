@@ -0,0 +1,132 @@
+# ai_mhbot/http_session.py
+# Per-process pooled requests.Session for the Google Maps / Places calls.
+#
+# Why: module-level requests.get()/post() build a throwaway Session per call, so
+# every Nearby, Details and Text Search request paid DNS + TCP + TLS again. One
+# Session per worker keeps connections to maps.googleapis.com and
+# places.googleapis.com alive and shares them across requests and threads.
+#
+# - HTTPAdapter pool sized for the Place Details fan-out (GOOGLE_HTTP_POOL_MAXSIZE
+#   should be >= GOOGLE_PLACES_DETAILS_WORKERS, or threads wait for a socket).
+# - Bounded urllib3 Retry: connect errors, 429 and 5xx only, short backoff.
+#   Retry-After is not honoured: a user is waiting, so we retry quickly or give up.
+# - Per-endpoint (connect, read) timeouts via timeout_for("nearby"|"details"|"text").
+# - Dropped (not closed) in a forked child, same as openai_clients.py.
+#
+# urllib3 Retry docs: https://urllib3.readthedocs.io/en/stable/reference/urllib3.util.html
+from __future__ import annotations
+# --- imports -------------------------------------------------------------------
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .env import env_float, env_int
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Read timeouts per Google endpoint (seconds); connect timeout is shared.
+_READ_TIMEOUT_DEFAULTS = {"nearby": 10.0, "details": 5.0, "text": 10.0}
+
+
+# --- settings (env) -----------------------------------------------------------
+def session_config() -> Dict:
+    return {
+        "pool_connections": env_int("GOOGLE_HTTP_POOL_CONNECTIONS", 4),  # distinct hosts kept
+        "pool_maxsize": env_int("GOOGLE_HTTP_POOL_MAXSIZE", 16),        # sockets per host
+        "retries": env_int("GOOGLE_HTTP_RETRIES", 2),
+        "backoff_factor": env_float("GOOGLE_HTTP_BACKOFF", 0.3),
+        "connect_timeout": env_float("GOOGLE_HTTP_CONNECT_TIMEOUT", 3.05),
+    }
+
+
+def timeout_for(endpoint: str) -> Tuple[float, float]:
+    """(connect, read) timeout for one Google endpoint: nearby | details | text."""
+    read = env_float(f"GOOGLE_{endpoint.upper()}_TIMEOUT", _READ_TIMEOUT_DEFAULTS.get(endpoint, 10.0))
+    return session_config()["connect_timeout"], read
+
+
+def _retry_policy(cfg: Dict) -> Retry:
+    return Retry(
+        total=cfg["retries"],
+        connect=cfg["retries"],
+        read=0,                      # a read timeout already spent the caller's budget
+        status=cfg["retries"],
+        backoff_factor=cfg["backoff_factor"],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset({"GET", "POST"}),  # searchText POST is a read
+        respect_retry_after_header=False,
+        raise_on_status=False,       # hand the last 429/5xx back; places.py turns it into PlacesError
+    )
+
+
+# --- registry -----------------------------------------------------------------
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_owner_pid = os.getpid()
+_stats: Dict[str, int] = {"sessions_built": 0}
+
+
+def _build_session() -> requests.Session:
+    cfg = session_config()
+    adapter = HTTPAdapter(
+        pool_connections=cfg["pool_connections"],
+        pool_maxsize=cfg["pool_maxsize"],
+        max_retries=_retry_policy(cfg),
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Shared Session for this process (requests.Session is safe to share across threads for plain calls)."""
+    global _session
+    if os.getpid() != _owner_pid:
+        reset_after_fork()
+    with _lock:
+        if _session is None:
+            _session = _build_session()
+            _stats["sessions_built"] += 1
+        return _session
+
+
+def session_stats() -> Dict:
+    """Sockets opened per host pool vs. requests served on them (keep-alive reuse)."""
+    with _lock:
+        session = _session
+        snap: Dict = {"pid": _owner_pid, **_stats, "pools": {}}
+    if session is not None:
+        adapter = session.get_adapter("https://")
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is not None:
+                snap["pools"][pool.host] = {"connections_opened": pool.num_connections, "requests": pool.num_requests}
+    snap["config"] = session_config()
+    return snap
+
+
+def reset_after_fork() -> None:
+    """Forget the parent's Session; its sockets belong to the parent process."""
+    global _session, _owner_pid, _lock
+    _lock = threading.Lock()
+    _session = None
+    _owner_pid = os.getpid()
+    _stats["sessions_built"] = 0
+
+
+def close_session() -> None:
+    """Close the pool (tests / graceful shutdown)."""
+    global _session
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
@@ -0,0 +1,116 @@
+"""
+Lightweight DB-backed job queue (no broker needed).
+
+- @job("name") registers a handler; enqueue("name", **payload) inserts a Job row
+- `python manage.py run_jobs` claims due jobs, runs each handler in a
+  transaction and deletes the row on success
+- Claiming is a conditional UPDATE, so several workers can poll the same table
+  without running a job twice; locked_until is the visibility timeout
+- Failures retry with exponential backoff until max_attempts, then stay
+  in the table as "failed" (visible in the admin) for inspection
+
+Settings: JOBS_EAGER (run inline, for dev/tests), JOBS_VISIBILITY_TIMEOUT,
+JOBS_MAX_ATTEMPTS.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_REGISTRY: Dict[str, Callable] = {}
+
+
+def job(name: str):
+    """Register a handler: @job("chat.record_mood")."""
+    def decorator(fn):
+        _REGISTRY[name] = fn
+        return fn
+    return decorator
+
+
+def _run_handler(name: str, payload: dict) -> None:
+    handler = _REGISTRY.get(name)
+    if handler is None:
+        raise LookupError(f"No job handler registered for {name!r}")
+    with transaction.atomic():
+        handler(**payload)
+
+
+def enqueue(name: str, *, delay: float = 0, max_attempts: int = None, **payload):
+    """
+    Queue a job for the worker. The payload must be JSON-serializable.
+    With JOBS_EAGER the handler runs inline instead (returns None).
+    """
+    if getattr(settings, "JOBS_EAGER", False):
+        _run_handler(name, payload)
+        return None
+    return Job.objects.create(
+        name=name,
+        payload=payload,
+        max_attempts=max_attempts or getattr(settings, "JOBS_MAX_ATTEMPTS", 5),
+        run_after=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def _claimable(now):
+    return Q(status="queued", run_after__lte=now) | Q(status="running", locked_until__lt=now)
+
+
+def claim(batch: int = 10) -> List[Job]:
+    """Atomically take up to `batch` due jobs (or jobs whose worker timed out)."""
+    now = timezone.now()
+    visibility = timedelta(seconds=getattr(settings, "JOBS_VISIBILITY_TIMEOUT", 60))
+    candidates = list(
+        Job.objects.filter(_claimable(now)).order_by("run_after", "id").values_list("id", flat=True)[:batch]
+    )
+    claimed = []
+    for job_id in candidates:
+        # Only one worker's UPDATE can still match the "claimable" condition.
+        won = Job.objects.filter(_claimable(now), id=job_id).update(
+            status="running", locked_until=now + visibility, attempts=F("attempts") + 1,
+        )
+        if won:
+            claimed.append(job_id)
+    return list(Job.objects.filter(id__in=claimed).order_by("id"))
+
+
+def run_job(job_row: Job) -> bool:
+    """Run one claimed job; True on success."""
+    try:
+        _run_handler(job_row.name, job_row.payload)
+    except Exception:
+        err = traceback.format_exc(limit=5)
+        logger.warning("Job %s (%s) failed on attempt %s", job_row.pk, job_row.name, job_row.attempts)
+        if job_row.attempts >= job_row.max_attempts:
+            Job.objects.filter(pk=job_row.pk).update(status="failed", locked_until=None, last_error=err)
+        else:
+            backoff = timedelta(seconds=min(2 ** job_row.attempts, 300))
+            Job.objects.filter(pk=job_row.pk).update(
+                status="queued", locked_until=None, run_after=timezone.now() + backoff, last_error=err,
+            )
+        return False
+    Job.objects.filter(pk=job_row.pk).delete()
+    return True
+
+
+def run_pending(batch: int = 10, max_jobs: int = None) -> int:
+    """Drain due jobs; returns how many ran (successfully or not)."""
+    ran = 0
+    while max_jobs is None or ran < max_jobs:
+        claimed = claim(batch)
+        if not claimed:
+            break
+        for job_row in claimed:
+            run_job(job_row)
+            ran += 1
+    return ran
@@ -0,0 +1,63 @@
+"""
+Cross-process file locks (gunicorn workers on one host share them).
+
+Uses fcntl.flock where available; elsewhere (Windows dev boxes) it degrades to
+an in-process lock, which is still correct for a single runserver process.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX
+    fcntl = None
+
+_local_locks = {}
+_local_guard = threading.Lock()
+
+
+class LockTimeout(Exception):
+    """Raised when a lock could not be acquired within the timeout."""
+
+
+def _thread_lock(path: str) -> threading.Lock:
+    with _local_guard:
+        return _local_locks.setdefault(path, threading.Lock())
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = 1.0, poll: float = 0.01):
+    """
+    Hold an exclusive lock on `path` (created if missing).
+    Raises LockTimeout if another process/thread keeps it longer than `timeout`.
+    """
+    tlock = _thread_lock(path)
+    if not tlock.acquire(timeout=timeout):
+        raise LockTimeout(path)
+    try:
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise LockTimeout(path)
+                    time.sleep(poll)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+    finally:
+        tlock.release()
@@ -0,0 +1,39 @@
+"""
+Move old conversations out of ChatMessage into compressed ChatArchive rows.
+
+    python manage.py archive_chat                       # idle > CHAT_ARCHIVE_AFTER_DAYS
+    python manage.py archive_chat --older-than-days 90
+    python manage.py archive_chat --dry-run             # just count
+
+Safe to rerun (e.g. nightly from cron); see ai_mhbot/chat_archive.py.
+"""
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_mhbot.chat_archive import archive_older_than
+
+
+class Command(BaseCommand):
+    help = "Archive chat conversations idle for longer than N days (compressed, per user per month)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, default=None,
+                            help="Default: CHAT_ARCHIVE_AFTER_DAYS.")
+        parser.add_argument("--dry-run", action="store_true", help="Count what would move; change nothing.")
+
+    def handle(self, *args, **opts):
+        days = opts["older_than_days"]
+        if days is None:
+            days = settings.CHAT_ARCHIVE_AFTER_DAYS
+        if days < 1:
+            raise CommandError("--older-than-days must be at least 1")
+
+        totals = archive_older_than(days, dry_run=opts["dry_run"])
+        if opts["dry_run"]:
+            self.stdout.write(f"Would archive {totals['messages']} messages from {totals['sessions']} conversations.")
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {totals['messages']} messages from {totals['sessions']} conversations "
+            f"into {totals['archives']} monthly archive updates."
+        ))
@@ -0,0 +1,140 @@
+"""
+Load VA / veteran-service facilities for the local Veterans Nearby index.
+
+    python manage.py import_va_facilities facilities.csv
+    python manage.py import_va_facilities facilities.json --replace
+
+Accepted inputs:
+- CSV with a header row: id, name, kind, address, city, state, zip, phone,
+  website, latitude, longitude (lat/lng/lon/long also accepted)
+- JSON: a list of objects with the same keys, or a VA Lighthouse Facilities
+  API dump ({"data": [{"id": ..., "attributes": {...}}]})
+
+Rows are upserted by id; --replace also deletes facilities missing from the file.
+"""
+
+import csv
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from ai_mhbot import facility_index
+from ai_mhbot.models import VAFacility
+
+BATCH = 500
+UPDATE_FIELDS = [
+    "name", "kind", "address", "city", "state", "zip_code",
+    "phone", "website", "latitude", "longitude", "updated_at",
+]
+
+
+def _first(rec, *keys):
+    for key in keys:
+        value = rec.get(key)
+        if value not in (None, ""):
+            return value
+    return ""
+
+
+def _from_lighthouse(rec):
+    """Flatten one VA Lighthouse record into the flat CSV-style keys."""
+    attrs = rec.get("attributes") or {}
+    physical = (attrs.get("address") or {}).get("physical") or {}
+    return {
+        "id": rec.get("id"),
+        "name": attrs.get("name"),
+        "kind": attrs.get("facility_type") or attrs.get("classification"),
+        "address": " ".join(x for x in (physical.get("address_1"), physical.get("address_2")) if x),
+        "city": physical.get("city"),
+        "state": physical.get("state"),
+        "zip": physical.get("zip"),
+        "phone": (attrs.get("phone") or {}).get("main"),
+        "website": attrs.get("website"),
+        "latitude": attrs.get("lat"),
+        "longitude": attrs.get("long"),
+    }
+
+
+def _to_facility(rec):
+    """Flat record -> unsaved VAFacility, or None when id/name/coordinates are missing."""
+    if "attributes" in rec:
+        rec = _from_lighthouse(rec)
+    ext_id = str(_first(rec, "id", "external_id")).strip()
+    name = str(_first(rec, "name")).strip()
+    try:
+        lat = float(_first(rec, "latitude", "lat"))
+        lng = float(_first(rec, "longitude", "lng", "lon", "long"))
+    except (TypeError, ValueError):
+        return None
+    if not ext_id or not name or not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return VAFacility(
+        external_id=ext_id[:64],
+        name=name[:255],
+        kind=str(_first(rec, "kind", "type", "facility_type"))[:32],
+        address=str(_first(rec, "address"))[:255],
+        city=str(_first(rec, "city"))[:100],
+        state=str(_first(rec, "state")).upper()[:2],
+        zip_code=str(_first(rec, "zip", "zip_code"))[:10],
+        phone=str(_first(rec, "phone"))[:32],
+        website=str(_first(rec, "website"))[:500],
+        latitude=lat,
+        longitude=lng,
+    )
+
+
+def _read_records(path, fmt):
+    with open(path, "r", encoding="utf-8-sig", newline="") as fh:
+        if fmt == "csv":
+            return list(csv.DictReader(fh))
+        data = json.load(fh)
+    if isinstance(data, dict):
+        data = data.get("data") or data.get("facilities") or []
+    return data
+
+
+class Command(BaseCommand):
+    help = "Import VA facilities (CSV or JSON) into the local Veterans Nearby index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSON file to import.")
+        parser.add_argument("--format", choices=["csv", "json"], help="Defaults to the file extension.")
+        parser.add_argument("--replace", action="store_true", help="Delete facilities not in this file.")
+
+    def handle(self, *args, **opts):
+        path = opts["path"]
+        if not os.path.exists(path):
+            raise CommandError(f"No such file: {path}")
+        fmt = opts["format"] or ("json" if path.lower().endswith(".json") else "csv")
+        try:
+            records = _read_records(path, fmt)
+        except (ValueError, csv.Error) as exc:
+            raise CommandError(f"Could not parse {path}: {exc}")
+
+        facilities, skipped = {}, 0
+        for rec in records:
+            fac = _to_facility(rec) if isinstance(rec, dict) else None
+            if fac is None:
+                skipped += 1
+                continue
+            facilities[fac.external_id] = fac  # last row wins for repeated ids
+
+        rows = list(facilities.values())
+        with transaction.atomic():
+            for start in range(0, len(rows), BATCH):
+                VAFacility.objects.bulk_create(
+                    rows[start:start + BATCH],
+                    update_conflicts=True,
+                    unique_fields=["external_id"],
+                    update_fields=UPDATE_FIELDS,
+                )
+            removed = 0
+            if opts["replace"]:
+                removed, _ = VAFacility.objects.exclude(external_id__in=list(facilities)).delete()
+        facility_index.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {len(rows)} facilities ({skipped} skipped, {removed} removed)."
+        ))
@@ -0,0 +1,34 @@
+"""
+Backfill / repair MoodSummary rows from MoodEntry history.
+
+    python manage.py rebuild_mood_summaries             # every user with entries
+    python manage.py rebuild_mood_summaries --user sean # one user
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from ai_mhbot.models import MoodEntry
+from ai_mhbot.mood_rollup import rebuild_summary
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-user mood rollup (last mood, streak, counts)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Only rebuild this username.")
+
+    def handle(self, *args, **opts):
+        if opts["user"]:
+            try:
+                user_ids = [User.objects.get(username=opts["user"]).pk]
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {opts['user']!r}")
+        else:
+            user_ids = MoodEntry.objects.order_by().values_list("user_id", flat=True).distinct()
+
+        done = 0
+        for user_id in user_ids:
+            rebuild_summary(user_id)
+            done += 1
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {done} mood summar{'y' if done == 1 else 'ies'}."))
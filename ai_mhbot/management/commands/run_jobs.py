@@ -0,0 +1,45 @@
+"""
+Background worker for the DB-backed job queue (ai_mhbot/jobs.py).
+
+    python manage.py run_jobs            # poll forever
+    python manage.py run_jobs --once     # drain what is due, then exit (cron / tests)
+"""
+
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from ai_mhbot.jobs import run_pending
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (post-reply writes, side effects)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Drain due jobs and exit.")
+        parser.add_argument("--batch", type=int, default=10, help="Jobs claimed per poll.")
+        parser.add_argument("--sleep", type=float, default=1.0, help="Idle seconds between polls.")
+
+    def handle(self, *args, **opts):
+        self._stop = False
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        if opts["once"]:
+            ran = run_pending(batch=opts["batch"])
+            self.stdout.write(f"Ran {ran} job(s).")
+            return
+
+        self.stdout.write("Job worker started.")
+        while not self._stop:
+            close_old_connections()
+            ran = run_pending(batch=opts["batch"], max_jobs=opts["batch"] * 10)
+            if not ran:
+                time.sleep(opts["sleep"])
+        self.stdout.write("Job worker stopped.")
+
+    def _request_stop(self, signum, frame):
+        # Finish the current job, then exit (its visibility timeout covers a hard kill).
+        self._stop = True
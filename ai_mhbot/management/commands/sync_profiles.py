@@ -0,0 +1,61 @@
+"""
+Backfill / repair Profile rows in bulk (instead of one signal call per user).
+
+    python manage.py sync_profiles             # create missing, fix stale copies
+    python manage.py sync_profiles --dry-run   # just count
+
+Profile's first_name / last_name / email are copied from User (see
+ensure_and_sync_profile in models.py); this fixes rows the signal never saw,
+e.g. users loaded from fixtures or changed with queryset.update().
+"""
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+
+from ai_mhbot.models import PROFILE_MIRRORED_FIELDS, Profile
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Create missing Profiles and re-copy name/email from User where they differ."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Count what would change; change nothing.")
+
+    def handle(self, *args, **opts):
+        missing = User.objects.filter(profile__isnull=True).values("pk", *PROFILE_MIRRORED_FIELDS)
+        differs = Q()
+        for field in PROFILE_MIRRORED_FIELDS:
+            differs |= ~Q(**{field: F(f"user__{field}")})
+        stale = Profile.objects.filter(differs).annotate(
+            **{f"user_{field}": F(f"user__{field}") for field in PROFILE_MIRRORED_FIELDS}
+        )
+
+        if opts["dry_run"]:
+            self.stdout.write(f"Would create {missing.count()} and repair {stale.count()} profiles.")
+            return
+
+        created = repaired = 0
+        with transaction.atomic():
+            rows = [
+                Profile(user_id=u.pop("pk"), **u)
+                for u in missing.iterator(chunk_size=BATCH_SIZE)
+            ]
+            Profile.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+            created = len(rows)
+
+            batch = []
+            for profile in stale.iterator(chunk_size=BATCH_SIZE):
+                for field in PROFILE_MIRRORED_FIELDS:
+                    setattr(profile, field, getattr(profile, f"user_{field}"))
+                batch.append(profile)
+                if len(batch) >= BATCH_SIZE:
+                    repaired += Profile.objects.bulk_update(batch, PROFILE_MIRRORED_FIELDS)
+                    batch = []
+            if batch:
+                repaired += Profile.objects.bulk_update(batch, PROFILE_MIRRORED_FIELDS)
+
+        self.stdout.write(self.style.SUCCESS(f"Created {created} and repaired {repaired} profiles."))
@@ -0,0 +1,106 @@
+"""
+Conversation memory for the chat assistant.
+
+- Recent turns: newest ChatMessage rows of the current session, as many as fit
+  CHAT_HISTORY_TOKEN_BUDGET (one bounded query, newest first)
+- Older turns: folded into that session's ChatSummary row. Folding is
+  incremental: only rows newer than ChatSummary.last_message_id are read, and
+  each is reduced to a one-line gist appended to the summary. The summary keeps
+  its newest lines within CHAT_SUMMARY_TOKEN_BUDGET.
+
+Prompt size is therefore capped by the two budgets no matter how long the
+conversation runs. The summary is extractive (no extra LLM call on the request path).
+"""
+
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List
+
+from django.conf import settings
+
+from .models import ChatMessage, ChatSummary
+from .prompting import estimate_tokens, estimate_messages_tokens
+
+# Upper bound on rows read per request (recent window + pending fold batch)
+RECENT_FETCH_LIMIT = 40
+FOLD_BATCH = 50
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+@dataclass
+class ChatContext:
+    history: List[Dict] = field(default_factory=list)  # [{"role", "content"}, ...] oldest first
+    summary: str = ""
+
+
+def _gist(msg: ChatMessage) -> str:
+    """One short line per folded message."""
+    text = " ".join((msg.content or "").split())
+    if msg.role == "assistant":
+        text = _SENTENCE_END.split(text, maxsplit=1)[0]
+        limit, who = 120, "Assistant"
+    else:
+        limit, who = 160, "User"
+    if len(text) > limit:
+        text = text[: limit - 1].rstrip() + "…"
+    return f"{who}: {text}"
+
+
+def _trim_summary(lines: List[str], budget: int) -> List[str]:
+    """Keep the newest lines that fit the summary budget."""
+    kept, used = [], 0
+    for line in reversed(lines):
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return list(reversed(kept))
+
+
+def fold_into_summary(summary: ChatSummary, messages: List[ChatMessage]) -> None:
+    """Append gists for `messages` (oldest first) and advance the fold watermark."""
+    if not messages:
+        return
+    lines = [ln for ln in summary.summary.splitlines() if ln.strip()]
+    lines.extend(_gist(m) for m in messages if (m.content or "").strip())
+    summary.summary = "\n".join(_trim_summary(lines, settings.CHAT_SUMMARY_TOKEN_BUDGET))
+    summary.last_message_id = messages[-1].id
+    summary.save(update_fields=["summary", "last_message_id", "updated_at"])
+
+
+def build_context(user, session_id: str, before_id: int) -> ChatContext:
+    """
+    Gather the turns that precede message `before_id` in this session:
+    recent ones verbatim (within budget) and older ones via the rolling summary.
+    """
+    summary, _ = ChatSummary.objects.get_or_create(session_id=session_id, defaults={"user": user})
+    base = (
+        ChatMessage.objects
+        .filter(user=user, session_id=session_id, role__in=("user", "assistant"),
+                id__gt=summary.last_message_id, id__lt=before_id)
+        .only("id", "role", "content")
+    )
+
+    recent = list(base.order_by("-id")[:RECENT_FETCH_LIMIT])
+    budget = settings.CHAT_HISTORY_TOKEN_BUDGET
+    history, used = [], 0
+    for msg in recent:
+        if not (msg.content or "").strip():
+            continue
+        turn = {"role": msg.role, "content": msg.content}
+        cost = estimate_messages_tokens([turn])
+        if used + cost > budget:
+            break
+        history.append(turn)
+        used += cost
+        oldest_kept = msg.id
+    history.reverse()
+
+    # Everything between the watermark and the oldest kept turn is folded now,
+    # in bounded batches (a very long backlog catches up over a few requests).
+    cutoff = oldest_kept if history else before_id
+    pending = list(base.filter(id__lt=cutoff).order_by("id")[:FOLD_BATCH])
+    fold_into_summary(summary, pending)
+
+    return ChatContext(history=history, summary=summary.summary)
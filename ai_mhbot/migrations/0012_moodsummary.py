@@ -0,0 +1,29 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_mhbot', '0011_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MoodSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_mood', models.CharField(blank=True, max_length=50)),
+                ('last_day', models.DateField(blank=True, null=True)),
+                ('streak', models.PositiveIntegerField(default=0)),
+                ('streak_end', models.DateField(blank=True, null=True)),
+                ('counts', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='mood_summary', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
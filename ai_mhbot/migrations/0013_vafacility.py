@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-17 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_mhbot', '0012_moodsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VAFacility',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('kind', models.CharField(blank=True, max_length=32)),
+                ('address', models.CharField(blank=True, max_length=255)),
+                ('city', models.CharField(blank=True, max_length=100)),
+                ('state', models.CharField(blank=True, max_length=2)),
+                ('zip_code', models.CharField(blank=True, max_length=10)),
+                ('phone', models.CharField(blank=True, max_length=32)),
+                ('website', models.URLField(blank=True, max_length=500)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
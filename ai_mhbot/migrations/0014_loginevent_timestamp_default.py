@@ -0,0 +1,19 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_mhbot', '0013_vafacility'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='loginevent',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,143 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:03
+
+import hashlib
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of ai_mhbot.user_agents as of this migration, so later changes
+# to the live parser never change what this migration writes.
+BROWSERS = [
+    ("Bot", re.compile(r"(?:bot|crawler|spider|slurp|curl|wget|python-requests|httpx)[/ ]?([\d.]*)", re.I)),
+    ("Edge", re.compile(r"Edg(?:e|A|iOS)?/([\d.]+)")),
+    ("Opera", re.compile(r"(?:OPR|Opera)/([\d.]+)")),
+    ("Samsung Internet", re.compile(r"SamsungBrowser/([\d.]+)")),
+    ("Firefox", re.compile(r"(?:Firefox|FxiOS)/([\d.]+)")),
+    ("Chrome", re.compile(r"(?:Chrome|CriOS)/([\d.]+)")),
+    ("Safari", re.compile(r"Version/([\d.]+).*Safari/")),
+    ("Internet Explorer", re.compile(r"(?:MSIE |Trident/.*rv:)([\d.]+)")),
+]
+OPERATING_SYSTEMS = [
+    ("iPadOS", re.compile(r"iPad.*OS (\d+[_\d]*)")),
+    ("iOS", re.compile(r"iPhone OS (\d+[_\d]*)")),
+    ("Android", re.compile(r"Android ([\d.]+)")),
+    ("ChromeOS", re.compile(r"CrOS \S+ ([\d.]+)")),
+    ("Windows", re.compile(r"Windows NT ([\d.]+)")),
+    ("macOS", re.compile(r"Mac OS X (\d+[_.\d]*)")),
+    ("Linux", re.compile(r"Linux()")),
+]
+WINDOWS_NT = {"10.0": "10/11", "6.3": "8.1", "6.2": "8", "6.1": "7"}
+
+
+def ua_hash(raw):
+    return hashlib.sha256(raw.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _major(version):
+    return version.replace("_", ".").split(".")[0] if version else ""
+
+
+def parse_user_agent(raw):
+    browser = version = os_name = ""
+    for name, pattern in BROWSERS:
+        m = pattern.search(raw)
+        if m:
+            browser, version = name, _major(m.group(1))
+            break
+    for name, pattern in OPERATING_SYSTEMS:
+        m = pattern.search(raw)
+        if m:
+            os_name = name
+            ver = m.group(1)
+            if name == "Windows":
+                ver = WINDOWS_NT.get(ver, ver)
+            elif ver:
+                ver = _major(ver)
+            if ver:
+                os_name = f"{name} {ver}"
+            break
+
+    if browser == "Bot":
+        device = "bot"
+    elif "iPad" in raw or "Tablet" in raw or ("Android" in raw and "Mobile" not in raw):
+        device = "tablet"
+    elif "Mobi" in raw or "iPhone" in raw:
+        device = "mobile"
+    else:
+        device = "desktop" if raw else ""
+    return {"browser": browser or "Other", "browser_version": version[:16], "os": os_name or "Other", "device": device}
+
+
+def move_user_agents(apps, schema_editor):
+    """One UserAgent per distinct string, then one UPDATE per string."""
+    LoginEvent = apps.get_model('ai_mhbot', 'LoginEvent')
+    UserAgent = apps.get_model('ai_mhbot', 'UserAgent')
+    raws = LoginEvent.objects.exclude(user_agent='').values_list('user_agent', flat=True).distinct()
+    for raw in list(raws):
+        agent, _ = UserAgent.objects.get_or_create(hash=ua_hash(raw), defaults={'raw': raw, **parse_user_agent(raw)})
+        LoginEvent.objects.filter(user_agent=raw).update(agent=agent)
+
+
+def restore_user_agents(apps, schema_editor):
+    LoginEvent = apps.get_model('ai_mhbot', 'LoginEvent')
+    UserAgent = apps.get_model('ai_mhbot', 'UserAgent')
+    for agent in UserAgent.objects.iterator():
+        LoginEvent.objects.filter(agent=agent).update(user_agent=agent.raw)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_mhbot', '0014_loginevent_timestamp_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserAgent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hash', models.CharField(max_length=64, unique=True)),
+                ('raw', models.TextField()),
+                ('browser', models.CharField(blank=True, max_length=32)),
+                ('browser_version', models.CharField(blank=True, max_length=16)),
+                ('os', models.CharField(blank=True, max_length=32)),
+                ('device', models.CharField(blank=True, max_length=16)),
+                ('first_seen', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # FK alongside the text column, fill it, then swap the two
+        migrations.AddField(
+            model_name='loginevent',
+            name='agent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='ai_mhbot.useragent'),
+        ),
+        migrations.RunPython(move_user_agents, restore_user_agents),
+        migrations.RemoveField(
+            model_name='loginevent',
+            name='user_agent',
+        ),
+        migrations.RenameField(
+            model_name='loginevent',
+            old_name='agent',
+            new_name='user_agent',
+        ),
+        migrations.AddIndex(
+            model_name='loginevent',
+            index=models.Index(fields=['-timestamp'], name='loginevent_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginevent',
+            index=models.Index(fields=['event', '-timestamp'], name='loginevent_event_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginevent',
+            index=models.Index(fields=['ip_address', '-timestamp'], name='loginevent_ip_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loginevent',
+            index=models.Index(fields=['username_tried'], name='loginevent_tried_idx'),
+        ),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 5.0.14 on 2026-10-17 03:08
+
+from django.db import migrations
+
+# Frozen copy of the schema fulltext.py queries, as of this migration: later
+# changes to the live module never change what this migration creates.
+SQLITE_INSTALL = [
+    # chat: ChatMessage.content
+    "CREATE VIRTUAL TABLE ai_mhbot_chatmessage_fts USING fts5(content, content='ai_mhbot_chatmessage', "
+    "content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER ai_mhbot_chatmessage_fts_ai AFTER INSERT ON ai_mhbot_chatmessage BEGIN "
+    "INSERT INTO ai_mhbot_chatmessage_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER ai_mhbot_chatmessage_fts_ad AFTER DELETE ON ai_mhbot_chatmessage BEGIN "
+    "INSERT INTO ai_mhbot_chatmessage_fts(ai_mhbot_chatmessage_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER ai_mhbot_chatmessage_fts_au AFTER UPDATE OF content ON ai_mhbot_chatmessage BEGIN "
+    "INSERT INTO ai_mhbot_chatmessage_fts(ai_mhbot_chatmessage_fts, rowid, content) "
+    "VALUES ('delete', old.id, old.content); "
+    "INSERT INTO ai_mhbot_chatmessage_fts(rowid, content) VALUES (new.id, new.content); END",
+    "INSERT INTO ai_mhbot_chatmessage_fts(ai_mhbot_chatmessage_fts) VALUES ('rebuild')",
+    # mood: MoodEntry.note + chat_user_text
+    "CREATE VIRTUAL TABLE ai_mhbot_moodentry_fts USING fts5(note, chat_user_text, content='ai_mhbot_moodentry', "
+    "content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER ai_mhbot_moodentry_fts_ai AFTER INSERT ON ai_mhbot_moodentry BEGIN "
+    "INSERT INTO ai_mhbot_moodentry_fts(rowid, note, chat_user_text) "
+    "VALUES (new.id, new.note, new.chat_user_text); END",
+    "CREATE TRIGGER ai_mhbot_moodentry_fts_ad AFTER DELETE ON ai_mhbot_moodentry BEGIN "
+    "INSERT INTO ai_mhbot_moodentry_fts(ai_mhbot_moodentry_fts, rowid, note, chat_user_text) "
+    "VALUES ('delete', old.id, old.note, old.chat_user_text); END",
+    "CREATE TRIGGER ai_mhbot_moodentry_fts_au AFTER UPDATE OF note, chat_user_text ON ai_mhbot_moodentry BEGIN "
+    "INSERT INTO ai_mhbot_moodentry_fts(ai_mhbot_moodentry_fts, rowid, note, chat_user_text) "
+    "VALUES ('delete', old.id, old.note, old.chat_user_text); "
+    "INSERT INTO ai_mhbot_moodentry_fts(rowid, note, chat_user_text) "
+    "VALUES (new.id, new.note, new.chat_user_text); END",
+    "INSERT INTO ai_mhbot_moodentry_fts(ai_mhbot_moodentry_fts) VALUES ('rebuild')",
+]
+
+SQLITE_UNINSTALL = [
+    f"DROP {kind} IF EXISTS {name}"
+    for table in ("ai_mhbot_chatmessage", "ai_mhbot_moodentry")
+    for kind, name in (
+        ("TRIGGER", f"{table}_fts_ai"),
+        ("TRIGGER", f"{table}_fts_ad"),
+        ("TRIGGER", f"{table}_fts_au"),
+        ("TABLE", f"{table}_fts"),
+    )
+]
+
+POSTGRES_INSTALL = [
+    "CREATE INDEX ai_mhbot_chatmessage_fts_gin ON ai_mhbot_chatmessage "
+    "USING GIN (to_tsvector('english', coalesce(content, '')))",
+    "CREATE INDEX ai_mhbot_moodentry_fts_gin ON ai_mhbot_moodentry "
+    "USING GIN (to_tsvector('english', coalesce(note, '') || ' ' || coalesce(chat_user_text, '')))",
+]
+
+POSTGRES_UNINSTALL = [
+    "DROP INDEX IF EXISTS ai_mhbot_chatmessage_fts_gin",
+    "DROP INDEX IF EXISTS ai_mhbot_moodentry_fts_gin",
+]
+
+
+def _sqlite_has_fts5(conn):
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+            cursor.execute("DROP TABLE temp._fts5_probe")
+        except Exception:
+            return False
+    return True
+
+
+def install(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor == "sqlite":
+        if not _sqlite_has_fts5(conn):
+            return  # SQLite without FTS5: searches fall back to icontains
+        statements = SQLITE_INSTALL
+    elif conn.vendor == "postgresql":
+        statements = POSTGRES_INSTALL
+    else:
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def uninstall(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {"sqlite": SQLITE_UNINSTALL, "postgresql": POSTGRES_UNINSTALL}.get(vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index over ChatMessage.content and MoodEntry.note/chat_user_text:
+    FTS5 table + sync triggers on SQLite, GIN expression index on Postgres.
+    (On SQLite, a later migration that rebuilds either table drops the triggers:
+    run fulltext.uninstall + install again after it.)
+    """
+
+    dependencies = [
+        ('ai_mhbot', '0016_chatarchive'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
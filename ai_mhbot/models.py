@@ -3,7 +3,7 @@ from django.db import models
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save
 from django.dispatch import receiver
 
 # ------------------------------ MoodEntry ------------------------------
@@ -40,6 +40,15 @@ class MoodEntry(models.Model):
     def __str__(self):
         return f"{self.user.username} · {self.day} · {self.mood}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember what was loaded so the MoodSummary rollup can apply the delta on save.
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance._loaded_mood = loaded.get("mood")
+        instance._loaded_day = loaded.get("day")
+        return instance
+
     @staticmethod
     def last_for_user(user):
         """Get the latest mood for quick UI defaults."""
@@ -50,6 +59,30 @@ class MoodEntry(models.Model):
             .first()
         )
 
+# ------------------------------ MoodSummary ------------------------------
+class MoodSummary(models.Model):
+    """
+    Per-user rollup of MoodEntry, kept current on every mood write (mood_rollup.py)
+    so the dashboard reads one row instead of scanning the user's history.
+    - last_mood/last_day: mood of the most recent day logged
+    - streak: consecutive days with an entry, ending at streak_end (the latest day)
+    - counts: {mood: number of days logged with that mood}
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="mood_summary")
+    last_mood = models.CharField(max_length=50, blank=True)
+    last_day = models.DateField(null=True, blank=True)
+    streak = models.PositiveIntegerField(default=0)
+    streak_end = models.DateField(null=True, blank=True)
+    counts = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"MoodSummary({self.user.username}: {self.last_mood or '-'}, streak {self.streak})"
+
+    def current_streak(self, today):
+        """Presence streak ending today (0 if nothing was logged today)."""
+        return self.streak if self.streak_end == today else 0
+
 # ------------------------------ Message (legacy) ------------------------------
 class Message(models.Model):
     """
@@ -82,6 +115,45 @@ class ChatMessage(models.Model):
         indexes = [models.Index(fields=["user", "created_at"])]
         ordering = ["created_at"]
 
+# ------------------------------ ChatArchive ------------------------------
+class ChatArchive(models.Model):
+    """
+    Cold storage for old ChatMessage rows (see chat_archive.py / `manage.py archive_chat`):
+    one row per user per month, the messages as zlib-compressed JSON. The hot
+    table keeps only recent conversations; chat_archive.iter_history reads both.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="chat_archives")
+    month = models.DateField()  # first day of the month (local time)
+    message_count = models.PositiveIntegerField(default=0)
+    first_at = models.DateTimeField()
+    last_at = models.DateTimeField()
+    raw_bytes = models.PositiveIntegerField(default=0)  # JSON size before compression
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "month"], name="chatarchive_user_month")]
+        ordering = ["month"]
+
+    def __str__(self):
+        return f"ChatArchive({self.user_id}, {self.month:%Y-%m}: {self.message_count} messages)"
+
+# ------------------------------ ChatSummary ------------------------------
+class ChatSummary(models.Model):
+    """
+    Rolling summary of the older turns in one chat session (see memory.py).
+    last_message_id is the newest ChatMessage already folded in, so each
+    update only reads messages after it.
+    """
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    session_id = models.CharField(max_length=64, unique=True)
+    summary = models.TextField(blank=True)
+    last_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"ChatSummary({self.session_id[:8]}…, upto #{self.last_message_id})"
+
 # ------------------------------ Profile ------------------------------
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="profile")
@@ -94,22 +166,61 @@ class Profile(models.Model):
     def __str__(self):
         return f"Profile({self.user.username})"
 
-def _sync_profile_from_user(user, profile):
-    """Copy data from User -> Profile (one-way)."""
-    changed = False
-    if profile.first_name != user.first_name:
-        profile.first_name = user.first_name; changed = True
-    if profile.last_name != user.last_name:
-        profile.last_name = user.last_name; changed = True
-    if profile.email != user.email:
-        profile.email = user.email; changed = True
-    if changed:
-        profile.save(update_fields=["first_name", "last_name", "email"])
+# User fields copied onto Profile; the signal below only does work when one of them changes
+PROFILE_MIRRORED_FIELDS = ("first_name", "last_name", "email")
+
+def _mirror_values(user):
+    # __dict__, not getattr: never load a deferred field just to compare it
+    return tuple(user.__dict__.get(f) for f in PROFILE_MIRRORED_FIELDS)
+
+@receiver(post_init, sender=User)
+def remember_mirrored_fields(sender, instance, **kwargs):
+    instance._profile_mirror = _mirror_values(instance)
 
 @receiver(post_save, sender=User)
-def ensure_and_sync_profile(sender, instance, created, **kwargs):
-    profile, _ = Profile.objects.get_or_create(user=instance)
-    _sync_profile_from_user(instance, profile)
+def ensure_and_sync_profile(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """
+    Keep Profile's copy of first/last name + email in step with User (one-way).
+    - New user: one INSERT (no lookup first)
+    - Save that touched none of the mirrored fields (e.g. the last_login update
+      on every login) or didn't change them: nothing at all
+    - Otherwise: one UPDATE; a missing Profile is created
+    Fixture loads (raw) are skipped; `manage.py sync_profiles` backfills/repairs in bulk.
+    """
+    if raw:
+        return
+    current = _mirror_values(instance)
+    if created:
+        Profile.objects.create(user=instance, **dict(zip(PROFILE_MIRRORED_FIELDS, current)))
+    elif update_fields is not None and not set(update_fields) & set(PROFILE_MIRRORED_FIELDS):
+        return
+    elif current != getattr(instance, "_profile_mirror", None):
+        values = {f: v for f, v in zip(PROFILE_MIRRORED_FIELDS, current) if v is not None}
+        if not Profile.objects.filter(user=instance).update(**values):
+            Profile.objects.create(user=instance, **values)
+        cached = instance._state.fields_cache.get("profile")
+        if cached is not None:
+            for field, value in values.items():
+                setattr(cached, field, value)
+    instance._profile_mirror = current
+
+# ------------------------------ UserAgent ------------------------------
+class UserAgent(models.Model):
+    """
+    One row per distinct User-Agent string, parsed once when first seen
+    (see user_agents.py). LoginEvent points here instead of repeating the text.
+    """
+    hash = models.CharField(max_length=64, unique=True)  # sha256 hex of raw
+    raw = models.TextField()
+    browser = models.CharField(max_length=32, blank=True)
+    browser_version = models.CharField(max_length=16, blank=True)  # major only
+    os = models.CharField(max_length=32, blank=True)
+    device = models.CharField(max_length=16, blank=True)  # desktop / mobile / tablet / bot
+    first_seen = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        name = f"{self.browser} {self.browser_version}".strip()
+        return f"{name} on {self.os}" if self.os else name
 
 # ------------------------------ LoginEvent ------------------------------
 class LoginEvent(models.Model):
@@ -121,10 +232,74 @@ class LoginEvent(models.Model):
         ("signup", "Signup"),
     ])
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    user_agent = models.TextField(blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    user_agent = models.ForeignKey(UserAgent, null=True, blank=True, on_delete=models.SET_NULL, related_name="events")
+    # Set when the event happens, not when the buffered writer (audit.py) inserts it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     username_tried = models.CharField(max_length=150, blank=True)
 
+    class Meta:
+        # Admin: default sort, event filter + sort, exact IP / username-prefix range
+        # search (LoginEventAdmin.get_search_results)
+        indexes = [
+            models.Index(fields=["-timestamp"], name="loginevent_ts_idx"),
+            models.Index(fields=["event", "-timestamp"], name="loginevent_event_ts_idx"),
+            models.Index(fields=["ip_address", "-timestamp"], name="loginevent_ip_ts_idx"),
+            models.Index(fields=["username_tried"], name="loginevent_tried_idx"),
+        ]
+
     def __str__(self):
         who = self.user.username if self.user else (self.username_tried or "unknown")
         return f"{self.event} by {who} @ {self.timestamp:%Y-%m-%d %H:%M:%S}"
+
+# ------------------------------ Job ------------------------------
+class Job(models.Model):
+    """
+    Row in the local background job queue (see jobs.py / `manage.py run_jobs`).
+    A worker claims a job by flipping it to running with locked_until in the
+    future; if the worker dies, the job becomes claimable again after that.
+    """
+    STATUS_CHOICES = [
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("failed", "Failed"),
+    ]
+    name = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "run_after"]),
+            models.Index(fields=["status", "locked_until"]),
+        ]
+
+    def __str__(self):
+        return f"Job#{self.pk} {self.name} [{self.status}, try {self.attempts}/{self.max_attempts}]"
+
+# ------------------------------ VAFacility ------------------------------
+class VAFacility(models.Model):
+    """
+    Local copy of VA / veteran-service locations for the Veterans Nearby search
+    (loaded by `manage.py import_va_facilities`, searched by facility_index.py).
+    """
+    external_id = models.CharField(max_length=64, unique=True)  # source dataset id, e.g. "vha_673"
+    name = models.CharField(max_length=255)
+    kind = models.CharField(max_length=32, blank=True)  # health / vet_center / benefits / cemetery / ...
+    address = models.CharField(max_length=255, blank=True)
+    city = models.CharField(max_length=100, blank=True)
+    state = models.CharField(max_length=2, blank=True)
+    zip_code = models.CharField(max_length=10, blank=True)
+    phone = models.CharField(max_length=32, blank=True)
+    website = models.URLField(max_length=500, blank=True)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.city}, {self.state})"
@@ -0,0 +1,94 @@
+"""
+Downsampled mood chart series, aggregated in the database.
+
+- Bucket size follows the requested range: day, then week, then month,
+  whichever keeps the series at or under MAX_POINTS buckets
+- One GROUP BY (bucket, mood) query; per bucket we return the count, the mean
+  mood score (same 0..7 scale the chart always used) and the most common mood
+- Payload size depends on the range, never on how many entries exist
+"""
+
+from datetime import date
+from typing import Dict, List, Optional
+
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+from .models import MoodEntry
+
+MAX_POINTS = 300
+
+# Chart y-axis: index in this list (unknown moods plot as 0)
+MOOD_ORDER = ["great", "good", "ok", "sad", "down", "angry", "anxious", "stressed"]
+MOOD_SCORE = {m: i for i, m in enumerate(MOOD_ORDER)}
+
+# ?range= choices on the dashboard -> days back from today (None = all history)
+RANGES = {"30d": 30, "90d": 90, "1y": 365, "all": None}
+DEFAULT_RANGE = "90d"
+
+_TRUNC = {"day": TruncDay, "week": TruncWeek, "month": TruncMonth}
+_LABEL = {"day": "%b %d", "week": "%b %d", "month": "%b %Y"}
+
+
+def pick_granularity(start: date, end: date) -> str:
+    days = (end - start).days + 1
+    if days <= MAX_POINTS:
+        return "day"
+    if days / 7 <= MAX_POINTS:
+        return "week"
+    return "month"
+
+
+def _clamp_months(start: date, end: date) -> date:
+    """Keep at most MAX_POINTS month buckets, dropping the oldest."""
+    months = (end.year - start.year) * 12 + end.month - start.month + 1
+    if months <= MAX_POINTS:
+        return start
+    index = end.year * 12 + end.month - 1 - (MAX_POINTS - 1)
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def chart_series(user, start: Optional[date], end: date) -> Dict:
+    """
+    Bucketed series for `user` between start and end (inclusive days).
+    start=None means "from the first entry".
+    """
+    entries = MoodEntry.objects.filter(user=user, day__lte=end)
+    if start is None:
+        start = entries.aggregate(first=Min("day"))["first"] or end
+    granularity = pick_granularity(start, end)
+    if granularity == "month":
+        start = _clamp_months(start, end)
+
+    rows = (
+        entries.filter(day__gte=start)
+        .annotate(bucket=_TRUNC[granularity]("day"))
+        .values("bucket", "mood")
+        .annotate(n=Count("id"))
+        .order_by("bucket")
+    )
+
+    buckets: Dict[date, Dict[str, int]] = {}
+    for row in rows:
+        buckets.setdefault(row["bucket"], {})[row["mood"]] = row["n"]
+
+    labels: List[str] = []
+    means: List[float] = []
+    modes: List[str] = []
+    counts: List[int] = []
+    for bucket, by_mood in buckets.items():
+        total = sum(by_mood.values())
+        labels.append(bucket.strftime(_LABEL[granularity]))
+        means.append(round(sum(MOOD_SCORE.get(m, 0) * n for m, n in by_mood.items()) / total, 2))
+        modes.append(max(sorted(by_mood), key=by_mood.get))  # ties: alphabetical, for stable output
+        counts.append(total)
+
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "labels": labels,
+        "values": means,
+        "modes": modes,
+        "counts": counts,
+    }
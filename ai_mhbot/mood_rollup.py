@@ -0,0 +1,105 @@
+"""
+Incremental MoodSummary maintenance.
+
+- post_save / post_delete on MoodEntry apply just the delta to the user's
+  MoodSummary row (counts ±1, streak extended or restarted, last mood)
+- MoodEntry.from_db remembers the loaded mood/day, so update_or_create on an
+  existing day knows which count to move
+- Rare cases the delta can't express (backdated entries, deletes, rows saved
+  without being loaded first) fall back to rebuild_summary() for that one user
+- rebuild_summary() is also what `manage.py rebuild_mood_summaries` runs
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import MoodEntry, MoodSummary
+
+
+def _streak_ending(days_desc, end_day):
+    """Length of the run of consecutive days ending at end_day (days_desc: newest first)."""
+    streak, expected = 0, end_day
+    for day in days_desc:
+        if day > expected:
+            continue
+        if day != expected:
+            break
+        streak += 1
+        expected = day - timedelta(days=1)
+    return streak
+
+
+def rebuild_summary(user_id) -> MoodSummary:
+    """Recompute one user's summary from their MoodEntry rows."""
+    rows = list(
+        MoodEntry.objects.filter(user_id=user_id)
+        .order_by("-day", "-created_at")
+        .values_list("day", "mood")
+    )
+    summary, _ = MoodSummary.objects.get_or_create(user_id=user_id)
+    if rows:
+        days_desc = sorted({day for day, _ in rows}, reverse=True)
+        summary.last_day, summary.last_mood = rows[0]
+        summary.streak_end = days_desc[0]
+        summary.streak = _streak_ending(days_desc, days_desc[0])
+        summary.counts = dict(Counter(mood for _, mood in rows))
+    else:
+        summary.last_day = summary.streak_end = None
+        summary.last_mood = ""
+        summary.streak = 0
+        summary.counts = {}
+    summary.save()
+    return summary
+
+
+def _apply_write(summary: MoodSummary, entry: MoodEntry, old_mood, created: bool) -> bool:
+    """Apply one save to the summary in place; False means "can't, rebuild instead"."""
+    counts = dict(summary.counts or {})
+    day = entry.day
+
+    if created:
+        end = summary.streak_end
+        if end is None or day > end + timedelta(days=1):
+            summary.streak, summary.streak_end = 1, day
+        elif day == end + timedelta(days=1):
+            summary.streak, summary.streak_end = summary.streak + 1, day
+        else:
+            return False  # backdated entry may join two runs
+    elif old_mood in counts:
+        counts[old_mood] -= 1
+        if counts[old_mood] <= 0:
+            del counts[old_mood]
+    else:
+        return False
+
+    counts[entry.mood] = counts.get(entry.mood, 0) + 1
+    summary.counts = counts
+    if summary.last_day is None or day >= summary.last_day:
+        summary.last_day, summary.last_mood = day, entry.mood
+    return True
+
+
+@receiver(post_save, sender=MoodEntry)
+def on_mood_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:  # loaddata: run rebuild_mood_summaries afterwards
+        return
+    old_mood = getattr(instance, "_loaded_mood", None)
+    old_day = getattr(instance, "_loaded_day", None)
+    with transaction.atomic():
+        summary, fresh = MoodSummary.objects.select_for_update().get_or_create(user_id=instance.user_id)
+        day_moved = not created and old_day != instance.day
+        if fresh or day_moved or not _apply_write(summary, instance, old_mood, created):
+            rebuild_summary(instance.user_id)
+        else:
+            summary.save()
+    instance._loaded_mood, instance._loaded_day = instance.mood, instance.day
+
+
+@receiver(post_delete, sender=MoodEntry)
+def on_mood_deleted(sender, instance, **kwargs):
+    if MoodSummary.objects.filter(user_id=instance.user_id).exists():
+        rebuild_summary(instance.user_id)
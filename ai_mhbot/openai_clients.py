@@ -0,0 +1,197 @@
+# ai_mhbot/openai_clients.py
+# Per-process registry of pooled OpenAI clients.
+#
+# Why: building OpenAI(api_key=...) per chat message means a fresh httpx pool,
+# DNS lookup and TLS handshake every time. Here one client (one keep-alive pool)
+# is shared by every request in the worker process.
+#
+# - Pool size, keep-alive and connect/read timeouts come from env vars (below).
+# - Clients are dropped (not closed) in a forked child: sockets inherited from the
+#   gunicorn master must never be reused by two processes.
+# - A tiny httpcore trace hook counts new connections and TLS handshake time, so
+#   pool_stats() can show how many handshakes keep-alive saved.
+#
+# httpx pool docs: https://www.python-httpx.org/advanced/resource-limits/
+# httpcore trace extension: https://www.encode.io/httpcore/extensions/#trace
+from __future__ import annotations
+# --- imports -------------------------------------------------------------------
+import asyncio
+import os
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from .env import env_float, env_int
+
+
+# --- settings (env) -----------------------------------------------------------
+def pool_config() -> Dict:
+    """Current pool/timeout knobs (read at client build time)."""
+    return {
+        "max_connections": env_int("OPENAI_POOL_MAX_CONNECTIONS", 20),
+        "max_keepalive": env_int("OPENAI_POOL_MAX_KEEPALIVE", 10),
+        "keepalive_expiry": env_float("OPENAI_POOL_KEEPALIVE_EXPIRY", 60.0),
+        "connect_timeout": env_float("OPENAI_CONNECT_TIMEOUT", 5.0),
+        "read_timeout": env_float("OPENAI_READ_TIMEOUT", 30.0),
+    }
+
+
+# --- stats --------------------------------------------------------------------
+_lock = threading.Lock()
+_stats: Dict[str, float] = {}
+
+def _reset_stats() -> None:
+    _stats.clear()
+    _stats.update(
+        pid=os.getpid(),
+        clients_built=0,
+        requests=0,
+        connections_opened=0,
+        handshake_ms_total=0.0,
+    )
+
+def _bump(key: str, amount: float = 1) -> None:
+    with _lock:
+        _stats[key] = _stats.get(key, 0) + amount
+
+def _make_trace():
+    """
+    Build a per-request httpcore trace callback.
+    connect_tcp.started → start_tls.complete is the cost keep-alive avoids.
+    """
+    started: Dict[str, float] = {}
+
+    def on_event(name: str) -> None:
+        if name == "connection.connect_tcp.started":
+            started["t"] = time.monotonic()
+            _bump("connections_opened")
+        elif name == "connection.start_tls.complete" and "t" in started:
+            _bump("handshake_ms_total", (time.monotonic() - started.pop("t")) * 1000.0)
+
+    def trace(name, info):
+        on_event(name)
+
+    async def atrace(name, info):
+        on_event(name)
+
+    return trace, atrace
+
+class _CountingTransport(httpx.HTTPTransport):
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        _bump("requests")
+        request.extensions.setdefault("trace", _make_trace()[0])
+        return super().handle_request(request)
+
+class _AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        _bump("requests")
+        request.extensions.setdefault("trace", _make_trace()[1])
+        return await super().handle_async_request(request)
+
+def pool_stats() -> Dict:
+    """
+    Snapshot of this process's pool usage:
+    requests served vs. connections opened, plus the average handshake cost
+    and an estimate of handshake time saved by reusing connections.
+    """
+    with _lock:
+        snap = dict(_stats)
+    opened = int(snap.get("connections_opened", 0))
+    reqs = int(snap.get("requests", 0))
+    avg = (snap.get("handshake_ms_total", 0.0) / opened) if opened else 0.0
+    snap["reused_requests"] = max(reqs - opened, 0)
+    snap["avg_handshake_ms"] = round(avg, 1)
+    snap["est_handshake_ms_saved"] = round(avg * snap["reused_requests"], 1)
+    snap["handshake_ms_total"] = round(snap.get("handshake_ms_total", 0.0), 1)
+    snap["config"] = pool_config()
+    return snap
+
+
+# --- registry -----------------------------------------------------------------
+_sync_client: Optional[OpenAI] = None
+# httpx async pools are bound to the event loop that created them
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_owner_pid = os.getpid()
+
+def _limits_and_timeout():
+    cfg = pool_config()
+    limits = httpx.Limits(
+        max_connections=cfg["max_connections"],
+        max_keepalive_connections=cfg["max_keepalive"],
+        keepalive_expiry=cfg["keepalive_expiry"],
+    )
+    timeout = httpx.Timeout(cfg["read_timeout"], connect=cfg["connect_timeout"])
+    return limits, timeout
+
+def _check_pid() -> None:
+    """Fallback fork check for servers that fork without os.register_at_fork hooks."""
+    if os.getpid() != _owner_pid:
+        reset_after_fork()
+
+def get_client() -> OpenAI:
+    """
+    Shared sync client for this process.
+    max_retries=0: complete_chat owns the retry policy, the SDK must not add its own.
+    """
+    global _sync_client
+    _check_pid()
+    with _lock:
+        if _sync_client is None:
+            limits, timeout = _limits_and_timeout()
+            _sync_client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=timeout,
+                http_client=httpx.Client(limits=limits, timeout=timeout, transport=_CountingTransport(limits=limits)),
+            )
+            _stats["clients_built"] = _stats.get("clients_built", 0) + 1
+        return _sync_client
+
+def get_async_client() -> AsyncOpenAI:
+    """Shared async client for the running event loop (ASGI worker)."""
+    _check_pid()
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            limits, timeout = _limits_and_timeout()
+            client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=0,
+                timeout=timeout,
+                http_client=httpx.AsyncClient(
+                    limits=limits, timeout=timeout, transport=_AsyncCountingTransport(limits=limits)
+                ),
+            )
+            _async_clients[loop] = client
+            _stats["clients_built"] = _stats.get("clients_built", 0) + 1
+        return client
+
+def reset_after_fork() -> None:
+    """
+    Forget every client inherited from the parent process.
+    Deliberately no close(): the sockets still belong to the parent.
+    """
+    global _sync_client, _async_clients, _owner_pid, _lock
+    _lock = threading.Lock()  # the parent's lock may have been held mid-fork
+    _sync_client = None
+    _async_clients = weakref.WeakKeyDictionary()
+    _owner_pid = os.getpid()
+    _reset_stats()
+
+def close_clients() -> None:
+    """Close the sync pool (tests / graceful shutdown)."""
+    global _sync_client
+    with _lock:
+        if _sync_client is not None:
+            _sync_client.close()
+            _sync_client = None
+
+
+_reset_stats()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_after_fork)
@@ -1,6 +1,10 @@
 # ai_mhbot/openai_utility.py
 # ChatGPT help – 2025-10-11: simplified to the current OpenAI Python SDK,
 # added small exponential backoff + Retry-After support, and a friendly fallback message.
+# Retries now run inside one per-request deadline (OPENAI_REQUEST_DEADLINE): every
+# attempt gets a timeout cut from what is left, and we only back off when there is
+# still room for another attempt afterwards. Worker time per chat is bounded.
+# A circuit breaker (circuit_breaker.py) skips OpenAI entirely during an outage.
 #
 # SDK reference (official):
 #   - Chat Completions: https://platform.openai.com/docs/api-reference/chat/create
@@ -11,12 +15,20 @@
 # Note: this code uses OpenAI Python SDK v1.x conventions.
 from __future__ import annotations
 # --- imports -------------------------------------------------------------------
+import asyncio
 import os
 import time
 import random
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 # --- OpenAI SDK imports --------------------------------------------------------
-from openai import OpenAI, RateLimitError, APIError  # SDK exceptions per 1.x
+from openai import APIConnectionError, APIError, RateLimitError  # SDK exceptions per 1.x
+# Pooled, per-process clients (keep-alive instead of a new TLS handshake per call)
+from .env import env_float
+from .openai_clients import get_async_client, get_client
+# Shared (cross-worker) circuit breaker: fail fast while OpenAI is down
+from .circuit_breaker import openai_breaker
+# Reply cache (normalized prompt → reply); see response_cache.py
+from . import response_cache
 
 # --- small helpers ------------------------------------------------------------
 # Try to read Retry-After header from exception (if any)
@@ -37,18 +49,109 @@ def _retry_after_from(exc: Exception) -> Optional[float]:
             return None
     return None
 
-# Exponential backoff with jitter, capped
-def _sleep_backoff(attempt: int, base: float = 0.4, cap: float = 8.0, retry_after: Optional[float] = None) -> None:
+# Exponential backoff with jitter, capped (Retry-After wins when the server sends it)
+def _backoff_delay(attempt: int, base: float = 0.4, cap: float = 8.0, retry_after: Optional[float] = None) -> float:
     """
-    Exponential backoff with jitter, capped. If server says Retry-After, honor it.
+    Seconds to wait before the next attempt.
     (Pattern based on OpenAI docs/guides – see links above.)
     """
-    # --- IGNORE ---
     if retry_after is not None:
-        time.sleep(min(max(retry_after, 0.0), cap))
-        return
-    delay = min(base * (2 ** (attempt - 1)), cap) + random.random() * 0.25
-    time.sleep(delay)
+        return min(max(retry_after, 0.0), cap)
+    return min(base * (2 ** (attempt - 1)), cap) + random.random() * 0.25
+
+# Structured fallback payload: {"message": ..., "resources": [...]}
+def _make_fallback(message_text: str) -> Dict:
+    resources = [
+        {"label": "Veterans Crisis Line", "url": "https://www.veteranscrisisline.net", "external": True},
+        {"label": "VA main site", "url": "https://www.va.gov", "external": True},
+        {"label": "Find Vet Centers", "url": "https://www.va.gov/find-locations", "external": True},
+        {"label": "National Suicide & Crisis Lifeline", "url": "tel:988", "external": True},
+        {"label": "Breathing exercise", "url": "/exercise/breathing/", "external": False},
+        {"label": "Grounding exercise", "url": "/exercise/grounding/", "external": False},
+        {"label": "Sleep exercise", "url": "/exercise/sleep/", "external": False},
+    ]
+    return {"message": message_text, "resources": resources}
+
+QUOTA_MESSAGE = (
+    "⚠️ I can’t reach the AI service because this project has no available credit. "
+    "I’m still here to listen and offer general support."
+)
+TROUBLE_MESSAGE = (
+    "⚠️ I’m having trouble contacting the AI service right now. "
+    "If you’re in crisis, call 988 (Press 1). Otherwise, I’m listening—tell me a bit more about what’s going on."
+)
+
+# --- deadline-aware retry policy ----------------------------------------------
+# Below this much time left, another attempt is not worth starting.
+MIN_ATTEMPT_SECONDS = 1.5
+
+class _Deadline:
+    """Total time budget for one chat request, shared by every attempt and backoff."""
+
+    def __init__(self, total: Optional[float] = None):
+        self.total = total if total is not None else env_float("OPENAI_REQUEST_DEADLINE", 20.0)
+        self.expires = time.monotonic() + self.total
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires - time.monotonic())
+
+    def attempt_timeout(self) -> Optional[float]:
+        """Timeout for the next attempt, or None when the budget is spent."""
+        left = self.remaining()
+        if left < MIN_ATTEMPT_SECONDS:
+            return None
+        return min(left, env_float("OPENAI_ATTEMPT_TIMEOUT", 12.0))
+
+    def room_to_wait(self, delay: float) -> bool:
+        return self.remaining() - delay >= MIN_ATTEMPT_SECONDS
+
+def _is_upstream_failure(exc: Exception) -> bool:
+    """429, 5xx, timeouts and connection errors: OpenAI itself is struggling."""
+    code = getattr(exc, "status_code", None)
+    if isinstance(exc, (RateLimitError, APIConnectionError)) or code == 429:
+        return True  # APIConnectionError includes APITimeoutError
+    return isinstance(exc, APIError) and bool(code) and 500 <= int(code) < 600
+
+def _is_quota_error(exc: Exception) -> bool:
+    txt = (getattr(exc, "message", "") or str(exc) or "").lower()
+    return "insufficient_quota" in txt or "check your plan and billing" in txt
+
+def _plan_retry(exc: Exception, attempt: int, max_retries: int, deadline: _Deadline) -> Tuple[str, float]:
+    """
+    Decide what to do after a failed attempt:
+      ("quota", 0)     → stop now, quota fallback (retrying won't help)
+      ("retry", delay) → wait `delay` seconds, then try again
+      ("stop", 0)      → stop, generic fallback
+    429 (too many requests), 5xx, timeouts and connection errors are retryable,
+    but only while the deadline leaves room for the wait plus one more attempt.
+    """
+    if not _is_upstream_failure(exc):
+        # Non-retryable API error or unexpected exception → fallback.
+        return "stop", 0.0
+    retry_after = None
+    if isinstance(exc, RateLimitError) or getattr(exc, "status_code", None) == 429:
+        # 429 can mean "too many requests" (retry) or "insufficient_quota" (stop).
+        if _is_quota_error(exc):
+            return "quota", 0.0
+        retry_after = _retry_after_from(exc)
+    if attempt >= max_retries:
+        return "stop", 0.0
+    delay = _backoff_delay(attempt, retry_after=retry_after)
+    if not deadline.room_to_wait(delay):
+        return "stop", 0.0
+    return "retry", delay
+
+def _prepare(messages: List[Dict], model: Optional[str], temperature: float, max_tokens: int, cache: bool):
+    """Shared preamble: API key check, model choice and reply-cache lookup."""
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("OPENAI_API_KEY is not set in the environment.")
+    use_model = model or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    if not cache:
+        response_cache.record_bypass()
+        return use_model, None, None
+    cache_key = response_cache.make_key(messages, use_model, temperature, max_tokens)
+    return use_model, cache_key, response_cache.lookup(cache_key)
 
 # --- main API -----------------------------------------------------------------
 # Make a chat completion request with retries and friendly fallback
@@ -58,97 +161,191 @@ def complete_chat(
     temperature: float = 0.3,
     max_tokens: int = 400,
     max_retries: int = 3,
-) -> str:
+    cache: bool = True,
+    deadline: Optional[float] = None,
+) -> Union[str, Dict]:
     """
     Make a chat completion request with small, clear retry logic.
 
     What this does (simple & safe):
     - Uses the OpenAI Python SDK (1.x) for Chat Completions.
-    - Retries a few times on 429 (rate limit) or transient 5xx errors,
-      honoring Retry-After if present.
+    - Retries a few times on 429 (rate limit), transient 5xx errors, timeouts and
+      dropped connections, honoring Retry-After if present.
+    - Everything (attempts + waits) fits in `deadline` seconds
+      (default OPENAI_REQUEST_DEADLINE); each attempt's timeout is whatever is
+      left, capped at OPENAI_ATTEMPT_TIMEOUT. Out of budget → fallback.
     - If the account has **insufficient_quota**, we do NOT keep retrying; we return
       a friendly message immediately (common 429 variant per docs).
     - On other errors, we stop and return a generic fallback once.
+    - While the shared circuit breaker is open we return the fallback without
+      calling OpenAI at all (see circuit_breaker.py).
+    - Identical (normalized) prompts are answered from response_cache unless
+      cache=False (the chat view passes False for crisis-flagged messages).
 
     ChatGPT help – 2025-10-11: kept this minimal so it’s easy to explain in class.
     """
-    # --- IGNORE ---
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise RuntimeError("OPENAI_API_KEY is not set in the environment.")
-    # --- IGNORE ---
-    client = OpenAI(api_key=api_key)
-    use_model = model or os.getenv("OPENAI_MODEL", "gpt-4o-mini")
-    #
-    last_exc: Optional[Exception] = None
-    # Retry loop
-    def _make_fallback(message_text: str):
-        resources = [
-            {"label": "Veterans Crisis Line", "url": "https://www.veteranscrisisline.net", "external": True},
-            {"label": "VA main site", "url": "https://www.va.gov", "external": True},
-            {"label": "Find Vet Centers", "url": "https://www.va.gov/find-locations", "external": True},
-            {"label": "National Suicide & Crisis Lifeline", "url": "tel:988", "external": True},
-            {"label": "Breathing exercise", "url": "/exercise/breathing/", "external": False},
-            {"label": "Grounding exercise", "url": "/exercise/grounding/", "external": False},
-            {"label": "Sleep exercise", "url": "/exercise/sleep/", "external": False},
-        ]
-        return {"message": message_text, "resources": resources}
+    use_model, cache_key, hit = _prepare(messages, model, temperature, max_tokens, cache)
+    if hit is not None:
+        return hit
+    client = get_client()
+    budget = _Deadline(deadline)
+    started = time.monotonic()
 
     for attempt in range(1, max_retries + 1):
+        timeout = budget.attempt_timeout()
+        if timeout is None or not openai_breaker.allow():
+            break
         try:
             resp = client.chat.completions.create(
                 model=use_model,
                 messages=messages,
                 temperature=temperature,
                 max_tokens=max_tokens,
+                timeout=timeout,
             )
-            return (resp.choices[0].message.content or "").strip()
-        # --- IGNORE ---
-        except RateLimitError as e:
-            # 429 can mean "too many requests" (retry) or "insufficient_quota" (stop).
-            txt = (str(e) or "").lower()
-            if "insufficient_quota" in txt or "check your plan and billing" in txt:
+            openai_breaker.record_success()
+            reply = (resp.choices[0].message.content or "").strip()
+            if cache_key:
+                response_cache.store(cache_key, reply, (time.monotonic() - started) * 1000.0)
+            return reply
+        except Exception as e:
+            if _is_upstream_failure(e):
+                openai_breaker.record_failure()
+            action, delay = _plan_retry(e, attempt, max_retries, budget)
+            if action == "quota":
                 # Helpful resources when API access is blocked
-                msg = (
-                    "⚠️ I can’t reach the AI service because this project has no available credit. "
-                    "I’m still here to listen and offer general support."
-                )
-                return _make_fallback(msg)
-            last_exc = e
-            _sleep_backoff(attempt, retry_after=_retry_after_from(e))
-            continue
-        # --- IGNORE ---
-        except APIError as e:
-            # Transient server errors (5xx) → retry; other status codes → stop.
-            code = getattr(e, "status_code", None)
-            # Some SDKs surface 429 as APIError; handle same as above:
-            if code == 429:
-                txt = (getattr(e, "message", "") or str(e)).lower()
-                if "insufficient_quota" in txt or "check your plan and billing" in txt:
-                    msg = (
-                        "⚠️ I can’t reach the AI service because this project has no available credit. "
-                        "I’m still here to listen and offer general support."
-                    )
-                    return _make_fallback(msg)
-                last_exc = e
-                _sleep_backoff(attempt, retry_after=_retry_after_from(e))
-                continue
-            if code and 500 <= int(code) < 600:
-                last_exc = e
-                _sleep_backoff(attempt)
-                continue
-            # Non-retryable API error, to fallback.
-            last_exc = e
-            break
+                return _make_fallback(QUOTA_MESSAGE)
+            if action == "stop":
+                break
+            time.sleep(delay)
+
+    # Friendly fallback
+    return _make_fallback(TROUBLE_MESSAGE)
+
+
+# Async twin of complete_chat for ASGI views (waits never block the event loop)
+async def acomplete_chat(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    temperature: float = 0.3,
+    max_tokens: int = 400,
+    max_retries: int = 3,
+    cache: bool = True,
+    deadline: Optional[float] = None,
+) -> Union[str, Dict]:
+    """Same contract and retry/deadline policy as complete_chat, using asyncio.sleep."""
+    use_model, cache_key, hit = _prepare(messages, model, temperature, max_tokens, cache)
+    if hit is not None:
+        return hit
+    client = get_async_client()
+    budget = _Deadline(deadline)
+    started = time.monotonic()
 
+    for attempt in range(1, max_retries + 1):
+        timeout = budget.attempt_timeout()
+        if timeout is None or not await asyncio.to_thread(openai_breaker.allow):
+            break
+        try:
+            resp = await client.chat.completions.create(
+                model=use_model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+            )
+            await asyncio.to_thread(openai_breaker.record_success)
+            reply = (resp.choices[0].message.content or "").strip()
+            if cache_key:
+                response_cache.store(cache_key, reply, (time.monotonic() - started) * 1000.0)
+            return reply
         except Exception as e:
-            # Network issues, timeouts, etc. to fallback after loop.
-            last_exc = e
+            if _is_upstream_failure(e):
+                await asyncio.to_thread(openai_breaker.record_failure)
+            action, delay = _plan_retry(e, attempt, max_retries, budget)
+            if action == "quota":
+                return _make_fallback(QUOTA_MESSAGE)
+            if action == "stop":
+                break
+            await asyncio.sleep(delay)
+
+    return _make_fallback(TROUBLE_MESSAGE)
+
+
+# --- streaming API ------------------------------------------------------------
+# Stream a chat completion token-by-token (used by the ASGI chat_stream view)
+async def astream_chat(
+    messages: List[Dict],
+    model: Optional[str] = None,
+    temperature: float = 0.3,
+    max_tokens: int = 400,
+    max_retries: int = 3,
+    cache: bool = True,
+    deadline: Optional[float] = None,
+) -> AsyncIterator[Union[str, Dict]]:
+    """
+    Async generator over a streamed chat completion.
+
+    - Yields text deltas (str) as soon as the model produces them.
+    - Opening the stream follows the same retry/deadline policy as complete_chat.
+      Once tokens reached the browser nothing is replayed: if the stream breaks
+      midway we simply stop and the caller keeps the partial reply.
+    - If no token ever arrives we yield the same structured fallback dict
+      complete_chat returns.
+    - A cached reply is yielded as one chunk; a completed stream is cached.
+    """
+    use_model, cache_key, hit = _prepare(messages, model, temperature, max_tokens, cache)
+    if hit is not None:
+        yield hit
+        return
+    client = get_async_client()
+    budget = _Deadline(deadline)
+    started = time.monotonic()
+
+    stream = None
+    for attempt in range(1, max_retries + 1):
+        timeout = budget.attempt_timeout()
+        if timeout is None or not await asyncio.to_thread(openai_breaker.allow):
+            break
+        try:
+            stream = await client.chat.completions.create(
+                model=use_model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=True,
+                timeout=timeout,
+            )
+            await asyncio.to_thread(openai_breaker.record_success)
             break
+        except Exception as e:
+            if _is_upstream_failure(e):
+                await asyncio.to_thread(openai_breaker.record_failure)
+            action, delay = _plan_retry(e, attempt, max_retries, budget)
+            if action == "quota":
+                yield _make_fallback(QUOTA_MESSAGE)
+                return
+            if action == "stop":
+                break
+            await asyncio.sleep(delay)
+    if stream is None:
+        yield _make_fallback(TROUBLE_MESSAGE)
+        return
 
-    # Friendly fallback
-    msg = (
-        "⚠️ I’m having trouble contacting the AI service right now. "
-        "If you’re in crisis, call 988 (Press 1). Otherwise, I’m listening—tell me a bit more about what’s going on."
-    )
-    return _make_fallback(msg)
+    parts: List[str] = []
+    finished = False
+    try:
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            delta = choice.delta.content
+            if delta:
+                parts.append(delta)
+                yield delta
+            if choice.finish_reason == "stop":
+                finished = True
+        if cache_key and finished:
+            response_cache.store(cache_key, "".join(parts).strip(), (time.monotonic() - started) * 1000.0)
+    except Exception:
+        if not parts:
+            yield _make_fallback(TROUBLE_MESSAGE)
@@ -0,0 +1,49 @@
+"""
+Keyset (cursor) pagination, newest first.
+
+Pages are "rows older than the last one I saw" instead of OFFSET n, so page
+50 costs the same index seek as page 1 and rows inserted meanwhile never
+shift or duplicate results. The cursor is an opaque urlsafe token wrapping
+(created_at, id); id breaks ties between rows with the same timestamp.
+"""
+
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, pk: int) -> str:
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        ts, pk = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(pk)
+    except Exception as exc:
+        raise InvalidCursor("Malformed cursor") from exc
+
+
+def keyset_page(queryset, cursor: Optional[str], limit: int):
+    """
+    One page of `queryset` ordered by (-created_at, -id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    """
+    qs = queryset.order_by("-created_at", "-id")
+    if cursor:
+        ts, pk = decode_cursor(cursor)
+        qs = qs.filter(Q(created_at__lt=ts) | Q(created_at=ts, id__lt=pk))
+    rows = list(qs[: limit + 1])  # one extra row tells us whether another page exists
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.pk)
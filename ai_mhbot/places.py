@@ -0,0 +1,189 @@
+"""
+Google Places calls behind the Veterans Nearby endpoint.
+
+- nearby_search(): legacy Nearby Search by lat/lng + radius (no phone/website)
+- add_details(): phone/website for the first GOOGLE_PLACES_DETAILS_LIMIT results,
+  from the place_id details cache when possible, otherwise fetched concurrently
+  on a per-process thread pool under one overall deadline
+- text_search(): Places API (New) places:searchText for city/state/ZIP text
+- Both return places in the Places API (New) shape the frontend reads
+  (displayName.text, formattedAddress, location, googleMapsUri, ...)
+- All calls share the pooled, retrying Session from http_session.py
+- Non-2xx answers (after retries) raise PlacesError; requests exceptions propagate to the view
+- The legacy endpoints answer 200 even for errors (OVER_QUERY_LIMIT, REQUEST_DENIED,
+  ...), so their JSON "status" is checked too; only OK / ZERO_RESULTS are used or cached
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional
+
+from . import places_cache
+from .env import env_float, env_int
+from .http_session import get_session, timeout_for
+
+NEARBY_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+DETAILS_URL = "https://maps.googleapis.com/maps/api/place/details/json"
+TEXT_SEARCH_URL = "https://places.googleapis.com/v1/places:searchText"
+
+VET_KEYWORDS = '(VA OR Veterans OR "Vet Center" OR "American Legion" OR VFW OR DAV)'
+
+
+OK_STATUSES = ("OK", "ZERO_RESULTS")
+
+
+class PlacesError(Exception):
+    """Google answered with a non-2xx status, or a legacy error status in the body."""
+
+    def __init__(self, error: str, details: str = ""):
+        super().__init__(error)
+        self.error = error
+        self.details = details
+
+
+def _details_limit() -> int:
+    return env_int("GOOGLE_PLACES_DETAILS_LIMIT", 10)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _details_executor() -> ThreadPoolExecutor:
+    """One small thread pool per process, built on first use (after any fork)."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=env_int("GOOGLE_PLACES_DETAILS_WORKERS", 8),
+                thread_name_prefix="places-details",
+            )
+        return _executor
+
+
+def _fetch_details(api_key: str, pid: str, timeout) -> Optional[Dict]:
+    """
+    One Place Details call; the answer is cached even if the request that
+    asked for it has stopped waiting. None when Google said no (not cached).
+    """
+    dparams = {
+        "place_id": pid,
+        "key": api_key,
+        "fields": "formatted_phone_number,international_phone_number,website",
+    }
+    dr = get_session().get(DETAILS_URL, params=dparams, timeout=timeout)
+    if not dr.ok:
+        return None
+    data = dr.json()
+    if data.get("status") not in OK_STATUSES:
+        return None
+    result = data.get("result", {})
+    places_cache.details_store(pid, result)
+    return result
+
+
+def _apply_details(p: Dict, result: Dict) -> None:
+    # Map into shape used by frontend
+    p["nationalPhoneNumber"] = result.get("formatted_phone_number")
+    p["internationalPhoneNumber"] = result.get("international_phone_number")
+    p["websiteUri"] = result.get("website")
+
+
+def add_details(api_key: str, places: List[Dict]) -> List[Dict]:
+    """
+    Copy of `places` with phone/website filled for the first
+    GOOGLE_PLACES_DETAILS_LIMIT results, and the internal place_id removed.
+
+    Cached details (places_cache) are used first; stale ones are served as-is
+    while one background refresh runs. Only cache misses go to Google, all in
+    parallel; whatever hasn't answered by GOOGLE_PLACES_DETAILS_DEADLINE is
+    skipped (those places keep None), so this costs at most one round trip.
+    """
+    out = [dict(p) for p in places]  # cached result lists are shared: never mutate them
+    pool = _details_executor()
+    background_timeout = timeout_for("details")
+
+    missing = []
+    for p in [p for p in out if p.get("place_id")][: _details_limit()]:
+        hit = places_cache.details_lookup(p["place_id"])
+        if hit is None:
+            missing.append(p)
+            continue
+        data, stale = hit
+        _apply_details(p, data)
+        if stale and places_cache.claim_refresh(p["place_id"]):
+            pool.submit(_fetch_details, api_key, p["place_id"], background_timeout)
+
+    if missing:
+        deadline = env_float("GOOGLE_PLACES_DETAILS_DEADLINE", 4.0)
+        connect, read = background_timeout
+        timeout = (min(connect, deadline), min(read, deadline))
+        futures = {pool.submit(_fetch_details, api_key, p["place_id"], timeout): p for p in missing}
+        done, not_done = wait(futures, timeout=deadline)
+        for fut in not_done:
+            fut.cancel()  # still queued: never starts; already running: result is cached, not shown
+
+        # Results are applied here, on the request thread, never from the workers.
+        for fut in done:
+            try:
+                result = fut.result()
+            except Exception:
+                # Ignore failures, return base data
+                continue
+            if result is not None:
+                _apply_details(futures[fut], result)
+
+    for p in out:
+        p.pop("place_id", None)
+    return out
+
+
+def nearby_search(api_key: str, lat: float, lng: float, radius: int) -> List[Dict]:
+    params = {
+        "key": api_key,
+        "location": f"{lat},{lng}",
+        "radius": int(radius),
+        "keyword": VET_KEYWORDS,
+    }
+    r = get_session().get(NEARBY_URL, params=params, timeout=timeout_for("nearby"))
+    if not r.ok:
+        raise PlacesError(f"NearbySearch {r.status_code}", r.text)
+    data = r.json()
+    status = data.get("status")
+    if status not in OK_STATUSES:
+        raise PlacesError(f"NearbySearch {status}", data.get("error_message", ""))
+
+    places = []
+    for res in data.get("results", []):
+        geom = res.get("geometry", {}).get("location", {})
+        pid = res.get("place_id")
+        places.append(
+            {
+                "displayName": {"text": res.get("name") or ""},
+                "formattedAddress": res.get("vicinity") or res.get("formatted_address") or "",
+                "location": {"latitude": geom.get("lat"), "longitude": geom.get("lng")},
+                "googleMapsUri": f"https://www.google.com/maps/search/?api=1&query=place_id:{pid}" if pid else None,
+                "nationalPhoneNumber": None,
+                "internationalPhoneNumber": None,
+                "websiteUri": None,
+                "place_id": pid,  # kept for add_details(); it strips it before responding
+            }
+        )
+    return places
+
+
+def text_search(api_key: str, place: str) -> List[Dict]:
+    headers = {
+        "Content-Type": "application/json",
+        "X-Goog-Api-Key": api_key,
+        "X-Goog-FieldMask": (
+            "places.id,places.displayName,places.formattedAddress,places.types,"
+            "places.location,places.nationalPhoneNumber,places.internationalPhoneNumber,"
+            "places.websiteUri,places.googleMapsUri"
+        ),
+    }
+    body = {"textQuery": f"{VET_KEYWORDS} in {place}", "pageSize": 20}
+    r = get_session().post(TEXT_SEARCH_URL, json=body, headers=headers, timeout=timeout_for("text"))
+    if not r.ok:
+        raise PlacesError(f"TextSearch {r.status_code}", r.text)
+    return r.json().get("places") or []
@@ -0,0 +1,211 @@
+"""
+Result cache for Veterans Nearby (Google Places) lookups.
+
+- lat/lng searches are keyed by geohash cell + radius bucket: the point is
+  snapped to its cell centre and the radius rounded up to a bucket, and that
+  snapped query is what goes to Google, so every request in the cell shares
+  one entry (and gets the same answer a cache hit would give)
+- place-text searches are keyed by the normalized text ("Tampa, FL" == "tampa fl")
+- Entries live in a Django cache alias (TTL + eviction handled by the backend),
+  so all workers pointed at a shared cache reuse each other's lookups
+- Only successful upstream answers are stored; errors are never cached
+- Place Details (phone/website) are cached separately per place_id with
+  stale-while-revalidate: fresh for PLACES_DETAILS_FRESH, then still served
+  (and refreshed in the background) until PLACES_DETAILS_TTL expires them.
+  Nearby results are cached without details, so each search re-applies the
+  newest details on top
+
+Settings: PLACES_CACHE_ENABLED, PLACES_CACHE_ALIAS, PLACES_CACHE_TTL,
+PLACES_DETAILS_FRESH, PLACES_DETAILS_TTL.
+"""
+
+import hashlib
+import re
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+KEY_PREFIX = "vets:v1"
+
+# Search radius is rounded UP to one of these (metres); the last one is Nearby Search's max.
+RADIUS_BUCKETS = (1600, 5000, 10000, 16093, 32186, 50000)
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+# ------------------------- geohash -------------------------
+def geohash_encode(lat: float, lng: float, precision: int) -> str:
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            ch = (ch << 1) | (lng >= mid)
+            lng_lo, lng_hi = (mid, lng_hi) if lng >= mid else (lng_lo, mid)
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            ch = (ch << 1) | (lat >= mid)
+            lat_lo, lat_hi = (mid, lat_hi) if lat >= mid else (lat_lo, mid)
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+
+def geohash_center(code: str):
+    """(lat, lng) at the centre of a geohash cell."""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in code:
+        value = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return (lat_lo + lat_hi) / 2, (lng_lo + lng_hi) / 2
+
+
+# ------------------------- keys -------------------------
+class NearbyCell(NamedTuple):
+    key: str
+    lat: float      # cell centre: the point actually sent upstream
+    lng: float
+    radius: int     # bucketed radius sent upstream
+
+
+def radius_bucket(radius_m: int) -> int:
+    for bucket in RADIUS_BUCKETS:
+        if radius_m <= bucket:
+            return bucket
+    return RADIUS_BUCKETS[-1]
+
+
+def nearby_cell(lat: float, lng: float, radius_m: int) -> NearbyCell:
+    radius = radius_bucket(radius_m)
+    # ~1.2 km cells for small radii, ~4.9 km cells otherwise: snapping error stays
+    # well under the search radius either way.
+    precision = 6 if radius <= 5000 else 5
+    code = geohash_encode(lat, lng, precision)
+    c_lat, c_lng = geohash_center(code)
+    return NearbyCell(f"{KEY_PREFIX}:nearby:{code}:{radius}", round(c_lat, 6), round(c_lng, 6), radius)
+
+
+def normalize_place(text: str) -> str:
+    return _NON_WORD.sub(" ", (text or "").lower()).strip()
+
+
+def text_key(place: str) -> str:
+    digest = hashlib.sha256(normalize_place(place).encode("utf-8")).hexdigest()[:32]
+    return f"{KEY_PREFIX}:text:{digest}"
+
+
+# ------------------------- counters -------------------------
+_stats_lock = threading.Lock()
+_stats = {
+    "hits": 0, "misses": 0, "stores": 0,
+    "details_fresh": 0, "details_stale": 0, "details_misses": 0, "details_stores": 0, "details_refreshes": 0,
+}
+
+
+def _bump(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def stats() -> Dict:
+    with _stats_lock:
+        snap = dict(_stats)
+    lookups = snap["hits"] + snap["misses"]
+    snap["hit_rate"] = round(snap["hits"] / lookups, 3) if lookups else 0.0
+    snap["alias"] = getattr(settings, "PLACES_CACHE_ALIAS", "default")
+    return snap
+
+
+# ------------------------- public API -------------------------
+def _enabled() -> bool:
+    return getattr(settings, "PLACES_CACHE_ENABLED", True)
+
+
+def _cache():
+    return caches[getattr(settings, "PLACES_CACHE_ALIAS", "default")]
+
+
+def lookup(key: str) -> Optional[List[Dict]]:
+    if not _enabled():
+        return None
+    try:
+        value = _cache().get(key)
+    except Exception:
+        value = None
+    _bump("hits" if value is not None else "misses")
+    return value
+
+
+def store(key: str, results: List[Dict]) -> None:
+    if not _enabled():
+        return
+    try:
+        _cache().set(key, results, getattr(settings, "PLACES_CACHE_TTL", 7 * 24 * 3600))
+        _bump("stores")
+    except Exception:
+        pass
+
+
+# ------------------------- Place Details (stale-while-revalidate) -------------------------
+def details_key(place_id: str) -> str:
+    return f"{KEY_PREFIX}:details:{place_id}"
+
+
+def details_lookup(place_id: str) -> Optional[Tuple[Dict, bool]]:
+    """(details, is_stale) from the cache, or None when there is nothing usable."""
+    if not _enabled():
+        return None
+    try:
+        entry = _cache().get(details_key(place_id))
+    except Exception:
+        entry = None
+    if not entry:
+        _bump("details_misses")
+        return None
+    stale = time.time() - entry["fetched_at"] > getattr(settings, "PLACES_DETAILS_FRESH", 7 * 24 * 3600)
+    _bump("details_stale" if stale else "details_fresh")
+    return entry["data"], stale
+
+
+def details_store(place_id: str, data: Dict) -> None:
+    if not _enabled():
+        return
+    try:
+        _cache().set(
+            details_key(place_id),
+            {"data": data, "fetched_at": time.time()},
+            getattr(settings, "PLACES_DETAILS_TTL", 30 * 24 * 3600),
+        )
+        _bump("details_stores")
+    except Exception:
+        pass
+
+
+def claim_refresh(place_id: str, hold_seconds: int = 60) -> bool:
+    """
+    True for exactly one caller (across workers sharing the cache) per place
+    per hold_seconds, so a stale entry is refreshed once, not by every search.
+    """
+    try:
+        claimed = bool(_cache().add(f"{KEY_PREFIX}:refreshing:{place_id}", 1, hold_seconds))
+    except Exception:
+        return False
+    if claimed:
+        _bump("details_refreshes")
+    return claimed
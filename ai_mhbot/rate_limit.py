@@ -0,0 +1,145 @@
+"""
+Per-user chat limits, shared by every worker through a Django cache alias.
+
+- Request rate: sliding window of CHAT_RATE_LIMIT_WINDOW seconds, approximated
+  with two fixed-window counters (the previous window is weighted by how much
+  of it still overlaps). At most CHAT_RATE_LIMIT_REQUESTS per window; refused
+  requests count too, so a script hammering the endpoint stays refused
+- Daily token budget: estimated prompt + reply tokens per user per local day,
+  charged after the reply (one request may overshoot); CHAT_DAILY_TOKEN_BUDGET=0
+  turns it off
+- Over a limit, the chat views answer with the usual fallback resources
+  (openai_utility._make_fallback) and never call OpenAI; the refused message is
+  still saved and its mood recorded
+- Messages the keyword screen flags as risk are never checked or counted
+  (views._limit_chat): a user in crisis always gets a real reply
+- Counters use cache.add + cache.incr, which are atomic on a shared cache such
+  as Redis; on a per-process cache (locmem) each worker counts on its own
+- Cache errors fail open: a broken cache never blocks chat
+
+Settings: CHAT_RATE_LIMIT_ENABLED, CHAT_RATE_LIMIT_ALIAS, CHAT_RATE_LIMIT_REQUESTS,
+CHAT_RATE_LIMIT_WINDOW, CHAT_DAILY_TOKEN_BUDGET.
+"""
+
+import math
+import threading
+import time
+from datetime import datetime, time as dt_time, timedelta
+from typing import Dict, NamedTuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils import timezone
+
+from .openai_utility import _make_fallback
+
+KEY_PREFIX = "chatlimit:v1"
+
+RATE_MESSAGE = (
+    "⏳ You’re sending messages faster than I can answer well. Take a slow breath and try again in a minute. "
+    "If you’re in crisis, call 988 (Press 1) now."
+)
+TOKENS_MESSAGE = (
+    "⏳ We’ve reached today’s chat limit for your account. It resets at midnight. "
+    "The exercises and resources below are always available, and if you’re in crisis, call 988 (Press 1)."
+)
+
+
+class Decision(NamedTuple):
+    allowed: bool
+    reason: str = ""       # "" | "rate" | "tokens"
+    retry_after: int = 0   # seconds
+
+
+ALLOWED = Decision(True)
+
+
+# ------------------------- counters -------------------------
+_stats_lock = threading.Lock()
+_stats = {"allowed": 0, "limited_rate": 0, "limited_tokens": 0, "errors": 0}
+
+
+def _bump(key: str) -> None:
+    with _stats_lock:
+        _stats[key] += 1
+
+
+def stats() -> Dict:
+    with _stats_lock:
+        snap = dict(_stats)
+    snap["enabled"] = _enabled()
+    snap["alias"] = getattr(settings, "CHAT_RATE_LIMIT_ALIAS", "default")
+    return snap
+
+
+# ------------------------- helpers -------------------------
+def _enabled() -> bool:
+    return getattr(settings, "CHAT_RATE_LIMIT_ENABLED", True)
+
+
+def _cache():
+    return caches[getattr(settings, "CHAT_RATE_LIMIT_ALIAS", "default")]
+
+
+def _incr(cache, key: str, delta: int, ttl: int) -> int:
+    """Atomic add-or-increment."""
+    if cache.add(key, delta, ttl):
+        return delta
+    try:
+        return cache.incr(key, delta)
+    except ValueError:  # expired between add and incr
+        cache.add(key, delta, ttl)
+        return delta
+
+
+def _tokens_key(user_id) -> str:
+    return f"{KEY_PREFIX}:tokens:{user_id}:{timezone.localdate().isoformat()}"
+
+
+def _seconds_to_midnight() -> int:
+    now = timezone.localtime()
+    midnight = timezone.make_aware(datetime.combine(now.date() + timedelta(days=1), dt_time.min))
+    return max(int((midnight - now).total_seconds()), 1)
+
+
+# ------------------------- public API -------------------------
+def check(user_id) -> Decision:
+    """Count one chat request for user_id and say whether it may go to the model."""
+    if not _enabled():
+        return ALLOWED
+    try:
+        cache = _cache()
+        budget = getattr(settings, "CHAT_DAILY_TOKEN_BUDGET", 0)
+        if budget and (cache.get(_tokens_key(user_id)) or 0) >= budget:
+            _bump("limited_tokens")
+            return Decision(False, "tokens", _seconds_to_midnight())
+
+        window = getattr(settings, "CHAT_RATE_LIMIT_WINDOW", 60)
+        now = time.time()
+        slot, into = divmod(now, window)
+        current = _incr(cache, f"{KEY_PREFIX}:req:{user_id}:{int(slot)}", 1, int(window * 2) + 1)
+        previous = cache.get(f"{KEY_PREFIX}:req:{user_id}:{int(slot) - 1}") or 0
+        estimate = previous * (1 - into / window) + current
+        if estimate > getattr(settings, "CHAT_RATE_LIMIT_REQUESTS", 8):
+            _bump("limited_rate")
+            return Decision(False, "rate", max(math.ceil(window - into), 1))
+    except Exception:
+        _bump("errors")
+        return ALLOWED
+    _bump("allowed")
+    return ALLOWED
+
+
+def charge_tokens(user_id, tokens: int) -> None:
+    """Add a finished request's (estimated) tokens to today's total."""
+    if not _enabled() or not getattr(settings, "CHAT_DAILY_TOKEN_BUDGET", 0) or tokens <= 0:
+        return
+    try:
+        _incr(_cache(), _tokens_key(user_id), int(tokens), 26 * 3600)
+    except Exception:
+        _bump("errors")
+
+
+def fallback_for(decision: Decision) -> Dict:
+    """The structured fallback payload ({"message", "resources"}) for a refused request."""
+    return _make_fallback(TOKENS_MESSAGE if decision.reason == "tokens" else RATE_MESSAGE)
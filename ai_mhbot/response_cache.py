@@ -0,0 +1,167 @@
+"""
+Reply cache in front of complete_chat / astream_chat.
+
+- Key: sha256 over the normalized message list + model + temperature + max_tokens
+  (case, curly quotes, whitespace and trailing punctuation are folded, so
+  "Can't sleep!!" and "can’t sleep" share an entry)
+- Backends: in-process LRU with TTL ("local") or any Django cache alias ("django")
+- Only successful string replies are stored; fallback payloads never are
+- Callers decide what is cacheable: the chat views only cache first turns
+  (system prompt + few-shots + user text, no history or summary) and never
+  crisis-flagged messages; later turns pass cache=False
+- Hits come back as CachedReply (a str), so callers can tell that no model
+  call was made (the chat views don't charge those to the token budget)
+
+Settings: CHAT_CACHE_BACKEND (local | django | off), CHAT_CACHE_TTL,
+CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_ALIAS.
+"""
+
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+_WS = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s.!?…]+$")
+_QUOTES = str.maketrans({"’": "'", "‘": "'", "“": '"', "”": '"'})
+
+
+class CachedReply(str):
+    """A reply served from this cache rather than generated by the model."""
+
+
+def normalize_text(text: str) -> str:
+    t = (text or "").translate(_QUOTES).lower()
+    t = _WS.sub(" ", t).strip()
+    return _TRAILING_PUNCT.sub("", t)
+
+
+def make_key(messages: List[Dict], model: str, temperature: float, max_tokens: int) -> str:
+    norm = [[m.get("role", ""), normalize_text(m.get("content", ""))] for m in messages]
+    raw = json.dumps([model, round(float(temperature), 3), int(max_tokens), norm], separators=(",", ":"))
+    return "chatcache:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+# ------------------------- backends -------------------------
+class LocalLRUCache:
+    """Thread-safe in-process LRU with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class DjangoCacheBackend:
+    """Delegates to a configured Django cache (TTL/eviction handled there)."""
+
+    def __init__(self, alias: str = "default"):
+        self.alias = alias
+
+    def get(self, key: str) -> Optional[str]:
+        return caches[self.alias].get(key)
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        caches[self.alias].set(key, value, ttl)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """Build the configured backend once per process; None when disabled."""
+    global _backend
+    kind = getattr(settings, "CHAT_CACHE_BACKEND", "local")
+    if kind == "off":
+        return None
+    with _backend_lock:
+        if _backend is None:
+            if kind == "django":
+                _backend = DjangoCacheBackend(getattr(settings, "CHAT_CACHE_ALIAS", "default"))
+            else:
+                _backend = LocalLRUCache(getattr(settings, "CHAT_CACHE_MAX_ENTRIES", 512))
+        return _backend
+
+
+# ------------------------- counters -------------------------
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stores": 0, "bypassed": 0, "miss_ms_total": 0.0}
+
+
+def _bump(key: str, amount=1) -> None:
+    with _stats_lock:
+        _stats[key] += amount
+
+
+def record_bypass() -> None:
+    _bump("bypassed")
+
+
+def stats() -> Dict:
+    """Hit/miss counters plus the LLM time hits avoided (avg miss latency × hits)."""
+    with _stats_lock:
+        snap = dict(_stats)
+    lookups = snap["hits"] + snap["misses"]
+    avg_miss = snap["miss_ms_total"] / snap["misses"] if snap["misses"] else 0.0
+    snap["hit_rate"] = round(snap["hits"] / lookups, 3) if lookups else 0.0
+    snap["avg_miss_ms"] = round(avg_miss, 1)
+    snap["est_ms_saved"] = round(avg_miss * snap["hits"], 1)
+    snap["miss_ms_total"] = round(snap["miss_ms_total"], 1)
+    snap["backend"] = getattr(settings, "CHAT_CACHE_BACKEND", "local")
+    return snap
+
+
+# ------------------------- public API -------------------------
+def lookup(key: str) -> Optional[str]:
+    backend = get_backend()
+    if backend is None:
+        return None
+    try:
+        value = backend.get(key)
+    except Exception:
+        value = None
+    _bump("hits" if value is not None else "misses")
+    return CachedReply(value) if isinstance(value, str) else value
+
+
+def store(key: str, reply, elapsed_ms: float = 0.0) -> None:
+    """Save a successful reply (plain, non-empty string) and record the miss cost."""
+    _bump("miss_ms_total", elapsed_ms)
+    backend = get_backend()
+    if backend is None or not isinstance(reply, str) or not reply.strip():
+        return
+    try:
+        backend.set(key, reply, getattr(settings, "CHAT_CACHE_TTL", 3600))
+        _bump("stores")
+    except Exception:
+        pass
@@ -0,0 +1,107 @@
+"""
+Single-pass keyword screening (Aho-Corasick).
+
+- One automaton is compiled at import from every vocabulary (risk, abuse, moods)
+- classify() walks the message once and reports every category that matched,
+  so cost is linear in message length no matter how many terms are listed
+- Matches must sit on word boundaries: "od" no longer fires on "good",
+  "mad" no longer fires on "made"
+- A term ending in "*" is a stem: it still needs a boundary on the left but may
+  run on to the right, so "overdos*" catches "overdosed" and "overdosing"
+- Text is lowercased and curly apostrophes are straightened first
+
+Reference: Aho & Corasick, "Efficient string matching" (CACM, 1975).
+"""
+
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+_APOSTROPHES = str.maketrans({"’": "'", "‘": "'"})
+
+
+def normalize(text: str) -> str:
+    return (text or "").translate(_APOSTROPHES).lower()
+
+
+class AhoCorasick:
+    """Trie + failure links over (pattern, label) pairs."""
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[List[Tuple[int, str, str]]] = [[]]  # (length, term, label)
+
+        for term, label in patterns:
+            term = normalize(term).strip()
+            if not term:
+                continue
+            node = 0
+            for ch in term:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((len(term), term, label))
+
+        # Breadth-first pass: failure link = longest proper suffix that is also a trie path
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[child] = self._goto[f].get(ch, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, str, str]]:
+        """Yield (start, end, term, label) for every occurrence in already-normalized text."""
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, term, label in out[node]:
+                yield i - length + 1, i + 1, term, label
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class TextScreener:
+    """Word-boundary-aware multi-category matcher built once from {category: terms}."""
+
+    def __init__(self, vocabularies: Dict[str, Iterable[str]]):
+        self.categories = list(vocabularies)
+        patterns: List[Tuple[str, str]] = []
+        self._stems: Set[Tuple[str, str]] = set()  # (label, term) allowed to run on to the right
+        for category, terms in vocabularies.items():
+            for term in terms:
+                if term.endswith("*"):
+                    term = term[:-1]
+                    self._stems.add((category, normalize(term).strip()))
+                patterns.append((term, category))
+        self._automaton = AhoCorasick(patterns)
+
+    def classify(self, text: str) -> Dict[str, Set[str]]:
+        """{category: {matched terms}} for every category with at least one hit."""
+        t = normalize(text)
+        n = len(t)
+        hits: Dict[str, Set[str]] = {}
+        for start, end, term, label in self._automaton.iter_matches(t):
+            if start > 0 and _is_word_char(t[start - 1]) and _is_word_char(term[0]):
+                continue
+            if (
+                end < n and _is_word_char(t[end]) and _is_word_char(term[-1])
+                and (label, term) not in self._stems
+            ):
+                continue
+            hits.setdefault(label, set()).add(term)
+        return hits
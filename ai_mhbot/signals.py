@@ -5,6 +5,7 @@ Created with help from ChatGPT (GPT-5).
 - Hooks Django's built-in auth signals to record: success, failure, logout
 - Captures client IP using django-ipware (best-effort behind proxies)
 - Stores User-Agent for basic device/browser context
+- Events go through the buffered audit writer (audit.py): no INSERT on the auth path
 
 Docs:
 - Django auth signals: https://docs.djangoproject.com/en/stable/ref/contrib/auth/#signals
@@ -16,7 +17,7 @@ from django.dispatch import receiver
 from django.contrib.auth import get_user_model
 from ipware import get_client_ip
 
-from .models import LoginEvent  # ensure this model exists (see previous step)
+from .audit import record_login_event
 
 User = get_user_model()
 
@@ -39,7 +40,7 @@ def on_user_logged_in(sender, request, user, **kwargs):
     Fires after a successful login.
     """
     ip, ua = _extract_ip_ua(request)
-    LoginEvent.objects.create(
+    record_login_event(
         user=user,
         event="login_success",
         ip_address=ip,
@@ -52,7 +53,7 @@ def on_user_logged_out(sender, request, user, **kwargs):
     Fires on logout.
     """
     ip, ua = _extract_ip_ua(request)
-    LoginEvent.objects.create(
+    record_login_event(
         user=user if isinstance(user, User) else None,
         event="logout",
         ip_address=ip,
@@ -69,7 +70,7 @@ def on_user_login_failed(sender, credentials, request, **kwargs):
     except Exception:
         pass
 
-    LoginEvent.objects.create(
+    record_login_event(
         user=None,
         event="login_failed",
         username_tried=username[:150],
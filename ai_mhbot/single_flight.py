@@ -0,0 +1,155 @@
+"""
+Single-flight: identical concurrent calls share one upstream fetch.
+
+- Within a process: the first caller for a key (the leader) runs the fetch;
+  every other thread asking for the same key waits on the leader's Future
+- Across workers on the host: the leader also holds a per-key file lock
+  (locking.py) and writes its JSON result to a shared file. A leader in another
+  worker that gets the lock next finds that fresh result and returns it
+  instead of calling upstream again
+- Results are only shared for SINGLE_FLIGHT_SHARE_SECONDS: this smooths a burst,
+  longer-lived caching is the caller's job (places_cache.py). A `share`
+  predicate keeps error answers out of the file (waiting threads still get them)
+- Fails open: if the lock or the leader takes longer than SINGLE_FLIGHT_WAIT,
+  the caller runs the fetch itself
+
+Env: SINGLE_FLIGHT_DIR, SINGLE_FLIGHT_WAIT, SINGLE_FLIGHT_SHARE_SECONDS.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import ExitStack
+from typing import Any, Callable, Dict, Optional
+
+from .env import env_float
+from .locking import LockTimeout, file_lock
+
+PRUNE_EVERY = 200          # writes between sweeps of old result/lock files
+PRUNE_AGE_SECONDS = 3600
+
+
+class SingleFlight:
+    def __init__(self, name: str, directory: Optional[str] = None):
+        self.name = name
+        self.directory = directory or os.getenv(
+            "SINGLE_FLIGHT_DIR", os.path.join(tempfile.gettempdir(), "vetmh_singleflight")
+        )
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._writes = 0
+        self._stats = {"leaders": 0, "local_followers": 0, "shared_followers": 0, "timeouts": 0}
+
+    # --- config (env, read per call like the circuit breaker) ---
+    @property
+    def wait_seconds(self) -> float:
+        return env_float("SINGLE_FLIGHT_WAIT", 20.0)
+
+    @property
+    def share_seconds(self) -> float:
+        return env_float("SINGLE_FLIGHT_SHARE_SECONDS", 5.0)
+
+    # --- shared result files ---
+    def _path(self, key: str) -> str:
+        digest = hashlib.sha256(f"{self.name}:{key}".encode("utf-8")).hexdigest()[:40]
+        return os.path.join(self.directory, digest)
+
+    def _read_shared(self, path: str):
+        try:
+            with open(path + ".json", "r", encoding="utf-8") as fh:
+                data = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data.get("at", 0) > self.share_seconds:
+            return None
+        return data
+
+    def _write_shared(self, path: str, value: Any) -> None:
+        try:
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump({"at": time.time(), "value": value}, fh)
+            os.replace(tmp, path + ".json")  # readers never see half a file
+        except (OSError, TypeError, ValueError):
+            return
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self._prune()
+
+    def _prune(self) -> None:
+        cutoff = time.time() - PRUNE_AGE_SECONDS
+        try:
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+        except OSError:
+            pass
+
+    def _bump(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] += 1
+
+    # --- public API ---
+    def do(self, key: str, fn: Callable[[], Any], share: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Return fn()'s result, running fn at most once per key among concurrent callers.
+        share(value) -> False keeps that value out of the cross-worker file.
+        """
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+
+        if not leader:
+            self._bump("local_followers")
+            try:
+                return fut.result(timeout=self.wait_seconds)
+            except FutureTimeout:
+                self._bump("timeouts")
+                return fn()
+
+        try:
+            value = self._lead(key, fn, share)
+        except BaseException as exc:
+            fut.set_exception(exc)
+            raise
+        else:
+            fut.set_result(value)
+            return value
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _lead(self, key: str, fn: Callable[[], Any], share) -> Any:
+        path = self._path(key)
+        with ExitStack() as stack:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                stack.enter_context(file_lock(path + ".lock", timeout=self.wait_seconds, poll=0.02))
+            except (LockTimeout, OSError):
+                # Another worker's leader is stuck (or the lock dir is unusable): don't wait forever.
+                self._bump("timeouts")
+                return fn()
+            shared = self._read_shared(path)
+            if shared is not None:
+                self._bump("shared_followers")
+                return shared["value"]
+            self._bump("leaders")
+            value = fn()  # outside the try: requests' errors subclass OSError and must reach the caller
+            if share is None or share(value):
+                self._write_shared(path, value)
+            return value
+
+    def stats(self) -> Dict:
+        with self._lock:
+            snap = dict(self._stats)
+            snap["in_flight"] = len(self._inflight)
+        return snap
+
+
+places_flight = SingleFlight("places")
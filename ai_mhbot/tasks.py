@@ -0,0 +1,68 @@
+"""
+Background job handlers (run by `manage.py run_jobs`, see jobs.py).
+
+These are the writes that used to happen inline after the chat reply (the
+detected mood; the assistant message itself stays inline) or an exercise
+completion. Each handler runs inside a transaction, so a retried job
+never leaves half of its rows behind. Dates are passed in from the request so a
+job that runs after midnight still lands on the right day.
+"""
+
+from datetime import date
+
+from .jobs import job
+from .models import ChatMessage, MoodEntry
+
+
+@job("chat.record_mood")
+def record_chat_mood(user_id, session_key, user_text, reply, pending_mood, day):
+    """
+    Save the day's mood entry detected in a chat turn (the assistant message
+    itself is written inline by the view). Stores chat context alongside the
+    mood snapshot for later review.
+    """
+    mood_val, note_txt = pending_mood
+    # Use update_or_create so we don't accidentally double-write moods for the same user/day.
+    MoodEntry.objects.update_or_create(
+        user_id=user_id,
+        day=date.fromisoformat(day),
+        defaults=dict(
+            mood=mood_val,
+            note=note_txt,
+            session_id=session_key,
+            chat_user_text=user_text,
+            chat_assistant_text=reply or "",
+        ),
+    )
+
+
+@job("exercise.record_completion")
+def record_exercise_completion(user_id, session_key, exercise, day):
+    """Chat acknowledgement + append the exercise to that day's mood note."""
+    # Assistant-style message acknowledging completion so it's visible in the chat history.
+    ChatMessage.objects.create(
+        user_id=user_id,
+        session_id=session_key,
+        role="assistant",
+        content=f"I see you completed the {exercise} exercise — well done. If you'd like, tell me how that felt.",
+        meta={"exercise_completed": exercise},
+    )
+
+    # Also log the exercise into that day's mood entry (append to note). Preserve existing mood if present.
+    the_day = date.fromisoformat(day)
+    existing = MoodEntry.objects.filter(user_id=user_id, day=the_day).first()
+    base_mood = existing.mood if existing else "ok"
+    new_note = ((existing.note or "") if existing else "").strip()
+    if new_note:
+        new_note = new_note + "\n"
+    new_note = new_note + f"Exercise completed: {exercise}"
+
+    MoodEntry.objects.update_or_create(
+        user_id=user_id,
+        day=the_day,
+        defaults=dict(
+            mood=base_mood,
+            note=new_note,
+            session_id=session_key,
+        ),
+    )
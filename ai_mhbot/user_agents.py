@@ -0,0 +1,125 @@
+"""
+User-Agent dictionary for LoginEvent.
+
+- Each distinct UA string is stored once in UserAgent, keyed by its sha256,
+  and parsed once (browser, version, OS, device class) when first seen
+- LoginEvent rows point at it with a small FK instead of repeating ~150 bytes
+- intern_user_agents() resolves a whole batch (audit.py flushes) with one
+  SELECT + at most one bulk INSERT; a bounded per-process map skips even that
+  for the handful of agents a site actually sees
+- The parser is a deliberately small regex table (no dependency), good enough
+  for the admin's browser/OS filters; the raw string is kept for anything else
+"""
+
+import hashlib
+import re
+import threading
+from typing import Dict, Iterable, Optional
+
+_CACHE_MAX = 4096
+_cache: Dict[str, int] = {}
+_cache_lock = threading.Lock()
+
+# (name, pattern with the version in group 1); first match wins, so order matters
+_BROWSERS = [
+    ("Bot", re.compile(r"(?:bot|crawler|spider|slurp|curl|wget|python-requests|httpx)[/ ]?([\d.]*)", re.I)),
+    ("Edge", re.compile(r"Edg(?:e|A|iOS)?/([\d.]+)")),
+    ("Opera", re.compile(r"(?:OPR|Opera)/([\d.]+)")),
+    ("Samsung Internet", re.compile(r"SamsungBrowser/([\d.]+)")),
+    ("Firefox", re.compile(r"(?:Firefox|FxiOS)/([\d.]+)")),
+    ("Chrome", re.compile(r"(?:Chrome|CriOS)/([\d.]+)")),
+    ("Safari", re.compile(r"Version/([\d.]+).*Safari/")),
+    ("Internet Explorer", re.compile(r"(?:MSIE |Trident/.*rv:)([\d.]+)")),
+]
+
+_OS = [
+    ("iPadOS", re.compile(r"iPad.*OS (\d+[_\d]*)")),
+    ("iOS", re.compile(r"iPhone OS (\d+[_\d]*)")),
+    ("Android", re.compile(r"Android ([\d.]+)")),
+    ("ChromeOS", re.compile(r"CrOS \S+ ([\d.]+)")),
+    ("Windows", re.compile(r"Windows NT ([\d.]+)")),
+    ("macOS", re.compile(r"Mac OS X (\d+[_.\d]*)")),
+    ("Linux", re.compile(r"Linux()")),
+]
+
+_WINDOWS_NT = {"10.0": "10/11", "6.3": "8.1", "6.2": "8", "6.1": "7"}
+
+
+def ua_hash(raw: str) -> str:
+    return hashlib.sha256(raw.encode("utf-8", "surrogatepass")).hexdigest()
+
+
+def _major(version: str) -> str:
+    return version.replace("_", ".").split(".")[0] if version else ""
+
+
+def parse_user_agent(raw: str) -> Dict[str, str]:
+    """{"browser", "browser_version" (major), "os", "device"} for a UA string."""
+    browser = version = os_name = ""
+    for name, pattern in _BROWSERS:
+        m = pattern.search(raw)
+        if m:
+            browser, version = name, _major(m.group(1))
+            break
+    for name, pattern in _OS:
+        m = pattern.search(raw)
+        if m:
+            os_name = name
+            ver = m.group(1)
+            if name == "Windows":
+                ver = _WINDOWS_NT.get(ver, ver)
+            elif ver:
+                ver = _major(ver)
+            if ver:
+                os_name = f"{name} {ver}"
+            break
+
+    if browser == "Bot":
+        device = "bot"
+    elif "iPad" in raw or "Tablet" in raw or ("Android" in raw and "Mobile" not in raw):
+        device = "tablet"
+    elif "Mobi" in raw or "iPhone" in raw:
+        device = "mobile"
+    else:
+        device = "desktop" if raw else ""
+    return {"browser": browser or "Other", "browser_version": version[:16], "os": os_name or "Other", "device": device}
+
+
+def intern_user_agents(raws: Iterable[str]) -> Dict[str, int]:
+    """Map each non-empty UA string to its UserAgent id, creating missing rows in bulk."""
+    from .models import UserAgent
+
+    wanted = {raw for raw in raws if raw}
+    out: Dict[str, int] = {}
+    with _cache_lock:
+        for raw in wanted:
+            if raw in _cache:
+                out[raw] = _cache[raw]
+    missing = {ua_hash(raw): raw for raw in wanted if raw not in out}
+    if missing:
+        found = dict(UserAgent.objects.filter(hash__in=list(missing)).values_list("hash", "id"))
+        new = [
+            UserAgent(hash=h, raw=raw, **parse_user_agent(raw))
+            for h, raw in missing.items() if h not in found
+        ]
+        if new:
+            # ignore_conflicts: another worker may insert the same agent concurrently
+            UserAgent.objects.bulk_create(new, ignore_conflicts=True)
+            found.update(UserAgent.objects.filter(hash__in=[u.hash for u in new]).values_list("hash", "id"))
+        with _cache_lock:
+            if len(_cache) + len(found) > _CACHE_MAX:
+                _cache.clear()
+            for h, pk in found.items():
+                _cache[missing[h]] = pk
+                out[missing[h]] = pk
+    return out
+
+
+def intern_user_agent(raw: str) -> Optional[int]:
+    return intern_user_agents([raw]).get(raw) if raw else None
+
+
+def clear_cache() -> None:
+    """Forget cached ids (tests; ids change when the table is rebuilt)."""
+    with _cache_lock:
+        _cache.clear()
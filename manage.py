@@ -6,7 +6,8 @@ import sys
 
 def main():
     """Run administrative tasks."""
-    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Vet_Mh.settings")
+    testing = len(sys.argv) > 1 and sys.argv[1] == "test"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Vet_Mh.settings_test" if testing else "Vet_Mh.settings")
 
     try:
         from django.core.management import execute_from_command_line